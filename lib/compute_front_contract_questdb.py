@@ -7,20 +7,31 @@ For each symbol and date, it sets the 'front_contract' flag to True for the
 symbol_period with the highest total volume (typically the front contract), and
 False for all others in the series.
 
+By default all symbols and days are marked with a single set-based UPDATE. Use
+--by-day to process one day and symbol at a time instead.
+
 Usage:
-  python compute_front_contract_questdb.py [--date YYYY-MM-DD] [--symbol SYMBOL]
+  python compute_front_contract_questdb.py [--date YYYY-MM-DD] [--by-day [--symbol SYMBOL]]
+
+Daily volumes are read from the 'trades_daily_volume' table, which is incrementally
+refreshed from 'trades' at the start of every run.
 
 Arguments:
   --date    Start date in YYYY-MM-DD format. If not provided, will prompt for input
             or start from the earliest date in the database.
-  --symbol  Symbol to start processing from. If not provided, will prompt for input
-            or process all symbols. Will process this symbol and all subsequent symbols.
+  --by-day  Process each symbol one day at a time, with symbols processed in parallel.
+  --symbol  Symbol to start processing from (only with --by-day). If not provided, will
+            prompt for input or process all symbols. Will process this symbol and all
+            subsequent symbols.
+  --rebuild-daily-volume
+            Recompute 'trades_daily_volume' from the full history instead of only the
+            days since the last run. Needed after backfilling older contracts.
 
 Examples:
   python compute_front_contract_questdb.py
   python compute_front_contract_questdb.py --date 2024-01-15
-  python compute_front_contract_questdb.py --symbol ESM4
-  python compute_front_contract_questdb.py --date 2024-01-15 --symbol ESM4
+  python compute_front_contract_questdb.py --by-day --symbol ESM4
+  python compute_front_contract_questdb.py --by-day --date 2024-01-15 --symbol ESM4
 
 Requirements:
   - QuestDB running and accessible
@@ -30,38 +41,57 @@ Requirements:
 
 import os
 import sys
+import time
 import argparse
-import psycopg2
+import psycopg
+from psycopg_pool import ConnectionPool
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 from datetime import datetime, timedelta
 
 # Load environment variables from .env file
 load_dotenv()
 
+def get_connection_params():
+    """Returns the QuestDB connection parameters from environment variables."""
+    return {
+        "host": os.getenv("QUESTDB_HOST", "localhost"),
+        "port": os.getenv("QUESTDB_PG_PORT", "8812"),
+        "user": os.getenv("QUESTDB_USER", "admin"),
+        "password": os.getenv("QUESTDB_PASSWORD", "quest"),
+        "dbname": "qdb"
+    }
+
 def get_db_connection():
     """Establishes a connection to the QuestDB database."""
     try:
-        conn = psycopg2.connect(
-            host=os.getenv("QUESTDB_HOST", "localhost"),
-            port=os.getenv("QUESTDB_PG_PORT", "8812"),
-            user=os.getenv("QUESTDB_USER", "admin"),
-            password=os.getenv("QUESTDB_PASSWORD", "quest"),
-            dbname="qdb"
-        )
+        conn = psycopg.connect(**get_connection_params())
         print("Successfully connected to QuestDB.")
         return conn
-    except psycopg2.Error as e:
+    except psycopg.Error as e:
         print(f"Error connecting to QuestDB: {e}", file=sys.stderr)
         sys.exit(1)
 
+def get_connection_pool(maxconn):
+    """Creates a thread-safe pool of up to maxconn connections to the QuestDB database."""
+    try:
+        pool = ConnectionPool(kwargs=get_connection_params(), min_size=1, max_size=maxconn, open=True)
+        print(f"Created QuestDB connection pool with up to {maxconn} connections.")
+        return pool
+    except psycopg.Error as e:
+        print(f"Error creating QuestDB connection pool: {e}", file=sys.stderr)
+        sys.exit(1)
+
 def get_symbols(cursor):
-    """Fetches all distinct symbols from the trades table."""
+    """Fetches all distinct symbols from the trades_daily_volume table."""
     try:
-        cursor.execute("SELECT DISTINCT symbol FROM trades;")
-        symbols = [row[0] for row in cursor.fetchall()]
+        # trades_daily_volume has one row per symbol, day and symbol_period, so this avoids
+        # scanning the full symbol column of the raw trades table
+        cursor.execute("SELECT DISTINCT symbol FROM trades_daily_volume ORDER BY symbol;")
+        symbols = [row[0] for row in cursor]
         print(f"Found symbols: {symbols}")
         return symbols
-    except psycopg2.Error as e:
+    except psycopg.Error as e:
         print(f"Error fetching symbols: {e}", file=sys.stderr)
         return []
 
@@ -73,80 +103,202 @@ def get_start_date(cursor):
         start_date = result[0] if result and result[0] else datetime.now()
         print(f"Earliest record in database is from: {start_date.strftime('%Y-%m-%d')}")
         return start_date
-    except psycopg2.Error as e:
+    except psycopg.Error as e:
         print(f"Error fetching start date: {e}", file=sys.stderr)
         return datetime.now()
 
+def get_trading_days(cursor, start_date):
+    """Fetches the days on or after start_date that have data in the trades_daily_volume table."""
+    try:
+        cursor.execute("""
+            SELECT DISTINCT day
+            FROM trades_daily_volume
+            WHERE day >= timestamp_floor('d', %s)
+            ORDER BY day;
+        """, (start_date,))
+        return [row[0] for row in cursor]
+    except psycopg.Error as e:
+        print(f"Error fetching trading days: {e}", file=sys.stderr)
+        return []
+
 def ensure_front_contract_column_exists(cursor):
     """Ensures the 'front_contract' column exists in the 'trades' table."""
     try:
-        # Check if the column exists
+        # Idempotent DDL, so no catalog lookup is needed to check for the column first
         cursor.execute("""
-            SELECT column_name
-            FROM information_schema.columns
-            WHERE table_name = 'trades' AND column_name = 'front_contract';
+            ALTER TABLE trades ADD COLUMN IF NOT EXISTS front_contract BOOLEAN;
         """)
-        result = cursor.fetchone()
-
-        if not result:
-            # Column doesn't exist, add it
-            cursor.execute("""
-                ALTER TABLE trades ADD COLUMN front_contract BOOLEAN DEFAULT FALSE;
-            """)
-            print("Added 'front_contract' column to 'trades' table.")
-        else:
-            print("'front_contract' column already exists in 'trades' table.")
-    except psycopg2.Error as e:
+        print("'front_contract' column exists in 'trades' table.")
+    except psycopg.Error as e:
         print(f"Error ensuring 'front_contract' column exists: {e}", file=sys.stderr)
         cursor.connection.rollback()
 
-def deduplicate_data(cursor, symbol, date_str):
+def wait_for_wal_apply(cursor, table_name, timeout=300):
+    """Waits until all committed WAL transactions of a table are applied and visible to queries."""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        cursor.execute("SELECT writerTxn, sequencerTxn FROM wal_tables() WHERE name = %s;", (table_name,))
+        result = cursor.fetchone()
+        if not result or result[0] >= result[1]:
+            return
+        time.sleep(0.5)
+    print(f"Warning: timed out waiting for '{table_name}' WAL transactions to be applied.", file=sys.stderr)
+
+def refresh_daily_volume(cursor, rebuild=False):
     """
-    For a given symbol and day, sets front_contract to True for the symbol_period with the highest volume
-    and False for the others.
+    Incrementally aggregates trades into the 'trades_daily_volume' table, which holds the
+    total volume per symbol, day and symbol_period. Only days from the last aggregated day
+    onwards are recomputed; the DEDUP UPSERT keys replace the rows of a partially
+    aggregated day. Use rebuild=True after backfilling data older than that day.
     """
     try:
-        # Get all symbol_periods for the given symbol and day, ordered by total volume
         cursor.execute("""
-            SELECT symbol_period, sum(volume) as total_volume
-            FROM trades
-            WHERE symbol = %s AND to_str(time, 'yyyy-MM-dd') = %s
-            GROUP BY symbol_period
-            ORDER BY total_volume DESC;
-        """, (symbol, date_str))
-
-        results = cursor.fetchall()
+            CREATE TABLE IF NOT EXISTS trades_daily_volume (
+                day TIMESTAMP,
+                symbol SYMBOL CAPACITY 256,
+                symbol_period SYMBOL CAPACITY 256,
+                total_volume LONG
+            ) TIMESTAMP(day)
+            PARTITION BY YEAR WAL
+            DEDUP UPSERT KEYS(day, symbol, symbol_period);
+        """)
 
-        if len(results) <= 1:
-            print(f"  - No overlapping data for symbol '{symbol}' on {date_str}. Skipping.")
-            return
+        watermark = None
+        if not rebuild:
+            cursor.execute("SELECT max(day) FROM trades_daily_volume;")
+            result = cursor.fetchone()
+            watermark = result[0] if result else None
 
-        # The first result is the one to set as front contract
-        symbol_period_to_keep = results[0][0]
-        print(f"  - Setting front_contract=True for symbol_period '{symbol_period_to_keep}' with volume {results[0][1]}.")
+        if watermark:
+            print(f"Aggregating daily volumes from {watermark.strftime('%Y-%m-%d')}...")
+            cursor.execute("""
+                INSERT INTO trades_daily_volume
+                SELECT timestamp_floor('d', time) AS day, symbol, symbol_period, sum(volume) AS total_volume
+                FROM trades
+                WHERE time >= %s
+                GROUP BY day, symbol, symbol_period;
+            """, (watermark,))
+        else:
+            print("Aggregating daily volumes for the full trades history...")
+            cursor.execute("""
+                INSERT INTO trades_daily_volume
+                SELECT timestamp_floor('d', time) AS day, symbol, symbol_period, sum(volume) AS total_volume
+                FROM trades
+                GROUP BY day, symbol, symbol_period;
+            """)
+        cursor.connection.commit()
+        wait_for_wal_apply(cursor, 'trades_daily_volume')
+        print("Daily volumes are up to date.")
+    except psycopg.Error as e:
+        print(f"Error refreshing daily volumes: {e}", file=sys.stderr)
+        cursor.connection.rollback()
 
-        # First, set all front_contract to False for this symbol and day
-        cursor.execute("""
-            UPDATE trades
-            SET front_contract = FALSE
-            WHERE symbol = %s AND to_str(time, 'yyyy-MM-dd') = %s;
-        """, (symbol, date_str))
+def get_daily_volumes(cursor, symbol, first_day, last_day):
+    """
+    Fetches the total volume of every symbol_period of a symbol for each day from first_day to
+    last_day (inclusive), as {day: [(symbol_period, total_volume), ...]} ordered by volume.
+    """
+    cursor.execute("""
+        SELECT day, symbol_period, total_volume
+        FROM trades_daily_volume
+        WHERE symbol = %s AND day >= %s AND day <= %s
+        ORDER BY day, total_volume DESC;
+    """, (symbol, first_day, last_day))
+
+    daily_volumes = {}
+    for day, symbol_period, total_volume in cursor:
+        daily_volumes.setdefault(day, []).append((symbol_period, total_volume))
+    return daily_volumes
+
+def deduplicate_data(cursor, symbol, day_start, results):
+    """
+    For a given symbol and day, sets front_contract to True for the symbol_period with the highest volume
+    and False for the others. day_start is the midnight timestamp of the day to process and results the
+    day's (symbol_period, total_volume) rows, ordered by total volume.
+    """
+    date_str = day_start.strftime("%Y-%m-%d")
+
+    if len(results) <= 1:
+        print(f"  - No overlapping data for symbol '{symbol}' on {date_str}. Skipping.")
+        return
+
+    # The first result is the one to set as front contract
+    symbol_period_to_keep = results[0][0]
+    print(f"  - {date_str}: setting front_contract=True for '{symbol}' symbol_period '{symbol_period_to_keep}' with volume {results[0][1]}.")
+
+    # Set front_contract to True for the highest volume symbol_period and False for the
+    # others in a single statement, so the day's partition is only rewritten once. The
+    # half-open [day_start, day_end) range on the designated timestamp lets QuestDB only
+    # touch the day's partition, and prepare=True has each pooled connection parse and
+    # plan the statement once for all its days
+    day_end = day_start + timedelta(days=1)
+    cursor.execute("""
+        UPDATE trades
+        SET front_contract = CASE WHEN symbol_period = %s THEN TRUE ELSE FALSE END
+        WHERE symbol = %s AND time >= %s AND time < %s;
+    """, (symbol_period_to_keep, symbol, day_start, day_end), prepare=True)
+    print(f"  - Set front_contract=False for {len(results) - 1} other symbol_periods.")
+
+def deduplicate_symbol(pool, symbol, first_day, last_day, checkpoint_days):
+    """
+    Runs deduplicate_data for one symbol on every day from first_day to last_day on a pooled
+    connection. The daily volumes are fetched in one query and the per-day UPDATEs are sent in
+    pipeline mode, so they are streamed back-to-back instead of waiting on one round-trip each.
+    The whole symbol is one transaction, with a checkpoint commit every checkpoint_days days.
+    """
+    conn = pool.getconn()
+    try:
+        print(f"  Processing symbol: '{symbol}'")
+        with conn.cursor() as cursor:
+            daily_volumes = get_daily_volumes(cursor, symbol, first_day, last_day)
+            with conn.pipeline():
+                for i, (day_start, results) in enumerate(daily_volumes.items(), start=1):
+                    deduplicate_data(cursor, symbol, day_start, results)
+                    # Checkpoint so a failure only loses the days since the last commit
+                    if checkpoint_days and i % checkpoint_days == 0:
+                        conn.commit()
+                        print(f"  - Checkpoint for symbol '{symbol}' at {day_start.strftime('%Y-%m-%d')}")
+                # Committing syncs the pipeline, which raises the first error of any queued UPDATE
+                conn.commit()
+        print(f"Committed changes for symbol '{symbol}'.")
+    except psycopg.Error as e:
+        print(f"  - Error processing symbol '{symbol}': {e}", file=sys.stderr)
+        conn.rollback()
+    finally:
+        pool.putconn(conn)
 
-        # Then, set front_contract to True for the highest volume symbol_period
+def mark_front_contracts(cursor, start_date):
+    """
+    Sets front_contract for every symbol and day from start_date onwards in a single
+    set-based UPDATE: True for the symbol_period with the highest daily volume, False
+    for the others. Like deduplicate_data, days with a single symbol_period are skipped.
+    """
+    try:
+        print(f"Marking front contracts for all symbols from {start_date.strftime('%Y-%m-%d')}...")
+        # Rank each symbol_period by its precomputed daily volume and join the winners back
+        # onto the trades table, so the whole date range is handled in one round-trip. Days
+        # with a single symbol_period have nothing to deduplicate and are left out, so their
+        # partitions are not rewritten
         cursor.execute("""
-            UPDATE trades
-            SET front_contract = TRUE
-            WHERE symbol = %s AND to_str(time, 'yyyy-MM-dd') = %s AND symbol_period = %s;
-        """, (symbol, date_str, symbol_period_to_keep))
-
-        # Get all other symbol_periods to set as not front contract
-        symbol_periods_to_set_false = [row[0] for row in results[1:]]
-
-        for sp_to_set_false in symbol_periods_to_set_false:
-            print(f"  - Setting front_contract=False for symbol_period '{sp_to_set_false}'.")
-
-    except psycopg2.Error as e:
-        print(f"  - Error processing symbol '{symbol}' on {date_str}: {e}", file=sys.stderr)
+            UPDATE trades t
+            SET front_contract = t.symbol_period = w.symbol_period
+            FROM (
+                SELECT symbol, day, symbol_period
+                FROM (
+                    SELECT symbol, day, symbol_period,
+                           row_number() OVER (PARTITION BY symbol, day ORDER BY total_volume DESC) AS rn,
+                           count(*) OVER (PARTITION BY symbol, day) AS symbol_periods
+                    FROM trades_daily_volume
+                    WHERE day >= timestamp_floor('d', %s)
+                )
+                WHERE rn = 1 AND symbol_periods > 1
+            ) w
+            WHERE t.symbol = w.symbol AND timestamp_floor('d', t.time) = w.day AND t.time >= %s;
+        """, (start_date, start_date))
+        print(f"  - Updated {cursor.rowcount} rows.")
+
+    except psycopg.Error as e:
+        print(f"  - Error marking front contracts from {start_date.strftime('%Y-%m-%d')}: {e}", file=sys.stderr)
         cursor.connection.rollback()
 
 
@@ -159,8 +311,8 @@ def main():
 Examples:
   %(prog)s
   %(prog)s --date 2024-01-15
-  %(prog)s --symbol AAPL
-  %(prog)s --date 2024-01-15 --symbol AAPL
+  %(prog)s --by-day --symbol AAPL
+  %(prog)s --by-day --date 2024-01-15 --symbol AAPL
         """
     )
     parser.add_argument(
@@ -171,7 +323,17 @@ Examples:
     parser.add_argument(
         "--symbol",
         type=str,
-        help="Symbol to start processing from. If not provided, will prompt for input or process all symbols."
+        help="Symbol to start processing from. Only used with --by-day. If not provided, will prompt for input or process all symbols."
+    )
+    parser.add_argument(
+        "--by-day",
+        action="store_true",
+        help="Process each symbol one day at a time instead of a single set-based UPDATE. Slower, but reports progress per day."
+    )
+    parser.add_argument(
+        "--rebuild-daily-volume",
+        action="store_true",
+        help="Recompute the trades_daily_volume table from the full history, e.g. after backfilling older data."
     )
 
     args = parser.parse_args()
@@ -183,6 +345,9 @@ Examples:
             ensure_front_contract_column_exists(cursor)
             conn.commit()
 
+            # Bring the precomputed daily volumes up to date with the trades table
+            refresh_daily_volume(cursor, rebuild=args.rebuild_daily_volume)
+
             # Get start date from command line argument or prompt
             start_date = None
             if args.date:
@@ -202,6 +367,12 @@ Examples:
                 else:
                     start_date = get_start_date(cursor)
 
+            if not args.by_day:
+                mark_front_contracts(cursor, start_date)
+                conn.commit()
+                print("\nDeduplication process completed.")
+                return
+
             # Get start symbol from command line argument or prompt
             user_start_symbol = args.symbol.upper() if args.symbol else None
             if not user_start_symbol:
@@ -221,26 +392,32 @@ Examples:
                 else:
                     print(f"Symbol '{user_start_symbol}' not found. Processing all symbols.")
 
-            end_date = datetime.now()
-            current_date = start_date
-
-            print(f"\nStarting deduplication from {current_date.strftime('%Y-%m-%d')} for symbols: {symbols_to_process}")
-
-            while current_date <= end_date:
-                date_str = current_date.strftime("%Y-%m-%d")
-                print(f"\nProcessing date: {date_str}")
-
-                for symbol in symbols_to_process:
-                    print(f"  Processing symbol: '{symbol}'")
-                    deduplicate_data(cursor, symbol, date_str)
-
-                # Commit changes for the current day
-                conn.commit()
-                print(f"\nCommitted changes for {date_str}")
+            # Only visit days that actually have data, rather than every calendar day up to now
+            trading_days = get_trading_days(cursor, start_date)
+            if not trading_days:
+                print(f"No data found on or after {start_date.strftime('%Y-%m-%d')}.")
+                return
 
-                current_date += timedelta(days=1)
-                # After the first day, all symbols should be processed
-                symbols_to_process = all_symbols
+            print(f"\nStarting deduplication from {trading_days[0].strftime('%Y-%m-%d')} for symbols: {symbols_to_process}")
+
+            # Symbols are independent of each other, so they are processed in parallel, every
+            # symbol on its own pooled connection
+            parallel_workers = int(os.getenv("PARALLEL_WORKERS", "8"))  # Default 8 parallel connections
+            checkpoint_days = int(os.getenv("CHECKPOINT_DAYS", "250"))  # Default commit roughly once per trading year
+            pool = get_connection_pool(parallel_workers)
+            try:
+                with ThreadPoolExecutor(max_workers=parallel_workers) as executor:
+                    futures = []
+                    for symbol in all_symbols:
+                        # Symbols before the start symbol are only processed after the first day
+                        days = trading_days if symbol in symbols_to_process else trading_days[1:]
+                        if days:
+                            futures.append(executor.submit(deduplicate_symbol, pool, symbol, days[0], days[-1], checkpoint_days))
+
+                    for future in futures:
+                        future.result()
+            finally:
+                pool.close()
 
 
             print("\nDeduplication process completed.")
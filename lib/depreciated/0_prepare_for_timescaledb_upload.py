@@ -10,9 +10,10 @@ The processing steps include:
 2. Standardizing time formats and combining date/time into a single 'time' column.
 3. Adding 'symbol' and 'symbol_period' columns (currently hardcoded to 'MES' and 'H5').
 4. Reordering columns for database compatibility.
-5. Optionally saving the processed data to a new CSV file (e.g., original_file_processed.csv).
+5. Optionally saving the processed data to a zstd-compressed parquet file
+   (e.g., original_file_processed.parquet).
 
-This processed CSV file is then intended to be used by '1_upload_to_postgres.py'
+This processed parquet file is then intended to be used by '1_upload_to_postgres.py'
 for efficient bulk insertion into the 'market_data' table.
 
 Usage:
@@ -26,6 +27,9 @@ Example:
 """
 
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pcsv
+import pyarrow.compute as pc
 from datetime import datetime
 import os
 
@@ -37,13 +41,17 @@ def process_trading_data(csv_file_path):
         csv_file_path (str): Path to the input CSV file
     """
     try:
-        # Load the CSV file
+        # Load the CSV file with the multithreaded Arrow reader, keeping Date and Time as strings
         print(f"Loading CSV file: {csv_file_path}")
-        df = pd.read_csv(csv_file_path)
+        table = pcsv.read_csv(
+            csv_file_path,
+            parse_options=pcsv.ParseOptions(delimiter=','),
+            convert_options=pcsv.ConvertOptions(column_types={'Date': pa.string(), ' Time': pa.string()})
+        )
         
         # Display original columns
-        print(f"Original columns: {list(df.columns)}")
-        print(f"Original data shape: {df.shape}")
+        print(f"Original columns: {table.column_names}")
+        print(f"Original data shape: {(table.num_rows, table.num_columns)}")
 
         # Rename columns
         column_mapping = {
@@ -59,26 +67,35 @@ def process_trading_data(csv_file_path):
             ' AskVolume': 'ask_volume'
         }
         
-        df = df.rename(columns=column_mapping)
+        table = table.rename_columns([column_mapping.get(name, name) for name in table.column_names])
         print("Renamed columns according to mapping")
         
-        # append .000 where the string length in ' Time' column is less than 10 characters
-        if 'trade_time' in df.columns:
-            df['trade_time'] = df['trade_time'].apply(lambda x: x + '.000' if len(x) < 11 else x)
+        # append .000 where the string length in ' Time' column is less than 11 characters.
+        # Runs as a vectorized Arrow kernel instead of a Python call per row
+        if 'trade_time' in table.column_names:
+            trade_time = table['trade_time']
+            trade_time = pc.if_else(
+                pc.less(pc.utf8_length(trade_time), 11),
+                pc.binary_join_element_wise(trade_time, '.000', ''),
+                trade_time
+            )
+            table = table.set_column(table.schema.get_field_index('trade_time'), 'trade_time', trade_time)
             print("Appended '.000' to 'trade_time' where necessary")
 
+        # Keep string columns Arrow-backed so the pandas .str/concat ops below stay in Arrow kernels
+        df = table.to_pandas(types_mapper={pa.string(): pd.StringDtype('pyarrow')}.get)
 
         # Convert trade_date to string (it's likely already a string, but ensuring consistency)
-        df['trade_date'] = df['trade_date'].astype(str)
+        df['trade_date'] = df['trade_date'].astype('string[pyarrow]')
         
 
-        # Create datetime column by combining trade_date and trade_time
-        df['time'] = pd.to_datetime(df['trade_date'] + ' ' + df['trade_time'].astype(str))
+        # Create datetime column by combining trade_date and trade_time in a single parse.
+        # trade_time keeps its leading space (' HH:MM:SS.fff'), which separates it from the date
+        df['time'] = pd.to_datetime(df['trade_date'] + df['trade_time'], cache=True)
         print("Created 'time' column by combining trade_date and trade_time into datetime")
         
-        # Convert trade_time to PostgreSQL-compatible time format
-        # Assuming the time format is HH:MM:SS.fff
-        df['trade_time'] = pd.to_datetime(df['trade_time'], format=' %H:%M:%S.%f').dt.time
+        # Convert trade_time to PostgreSQL-compatible time format, taken from the parsed timestamp
+        df['trade_time'] = df['time'].dt.time
         print("Converted trade_time to time format")
         
         # Add new columns
@@ -103,16 +120,16 @@ def process_trading_data(csv_file_path):
         print("\nData types:")
         print(df.dtypes)
         
-        # Ask user if they want to save to CSV
-        save_response = input("\nDo you want to save this processed data to a CSV file? (y/n): ").lower().strip()
+        # Ask user if they want to save to parquet
+        save_response = input("\nDo you want to save this processed data to a parquet file? (y/n): ").lower().strip()
         
         if save_response in ['y', 'yes']:
             # Generate output filename
             base_name = os.path.splitext(csv_file_path)[0]
-            output_file = f"{base_name}_processed.csv"
+            output_file = f"{base_name}_processed.parquet"
             
-            # Save to CSV
-            df.to_csv(output_file, index=False)
+            # Save to compressed columnar parquet, which the upload step reads without text parsing
+            df.to_parquet(output_file, index=False, compression='zstd', engine='pyarrow')
             print(f"Data saved to: {output_file}")
             
             # Display summary
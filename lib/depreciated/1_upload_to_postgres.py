@@ -2,17 +2,18 @@
 1_upload_to_postgres.py
 
 This script is the second step in the data ingestion pipeline. It is designed
-to efficiently upload processed CSV trading data into a PostgreSQL/TimescaleDB
-database.
+to efficiently upload processed trading data (parquet or CSV) into a
+PostgreSQL/TimescaleDB database.
 
 It works in conjunction with '0_prepare_for_timescaledb_upload.py', which
-generates the standardized CSV files that this script consumes. After data
+generates the standardized parquet files that this script consumes. After data
 is uploaded, '2_deduplicate.py' can be used to clean and deduplicate the
 uploaded trade data.
 
-The script provides two methods for bulk upload:
+The script provides three methods for bulk upload:
 1. COPY method (recommended for performance)
 2. Batch insert method (for compatibility)
+3. Binary COPY method (pgcopy, skips text parsing on the server)
 
 Usage:
     python3 1_upload_to_postgres.py
@@ -28,21 +29,80 @@ Example:
 """
 
 import pandas as pd
+import pyarrow.parquet as pq
 import psycopg2
-from psycopg2.extras import execute_batch
+from psycopg2.extras import execute_values
+from pgcopy import CopyManager
 import io
 import os
+import queue
+import threading
 from datetime import datetime
+from decimal import Decimal
 from dotenv import load_dotenv
 
 load_dotenv()
 
-def bulk_upload_to_postgres(csv_file_path, table_name, connection_params, create_table=True, batch_size=10000):
+# Server-side casts for the processed CSV columns, used in the execute_values row template.
+# trade_date is left uncast, so it keeps the source text like the COPY method does
+COLUMN_CASTS = {
+    'trade_time': 'time',
+    'time': 'timestamp',
+    'open': 'numeric',
+    'high': 'numeric',
+    'low': 'numeric',
+    'close': 'numeric',
+    'volume': 'int',
+    'number_of_trades': 'int',
+    'bid_volume': 'int',
+    'ask_volume': 'int'
+}
+
+def is_parquet(file_path):
+    """Return True if the file is a parquet file, judged by its extension"""
+    return file_path.lower().endswith('.parquet')
+
+def read_chunks(file_path, chunksize, prefetch=2):
+    """
+    Yield the parquet or CSV file as DataFrames of up to chunksize rows.
+    Parquet files are streamed by record batch, CSV files are parsed in chunks.
+    Chunks are read on a background thread into a bounded queue, so reading the
+    next chunk overlaps with uploading the current one while memory stays bounded
+    to a few chunks.
     """
-    Bulk upload CSV data to PostgreSQL table using efficient COPY method.
+    chunks = queue.Queue(maxsize=prefetch)
+    
+    def producer():
+        try:
+            if is_parquet(file_path):
+                for batch in pq.ParquetFile(file_path).iter_batches(batch_size=chunksize):
+                    chunks.put(batch.to_pandas())
+            else:
+                for chunk in pd.read_csv(file_path, chunksize=chunksize):
+                    chunks.put(chunk)
+            chunks.put(None)
+        except Exception as e:
+            chunks.put(e)
+    
+    threading.Thread(target=producer, daemon=True).start()
+    
+    while True:
+        chunk = chunks.get()
+        if chunk is None:
+            return
+        if isinstance(chunk, Exception):
+            raise chunk
+        yield chunk
+
+def bulk_upload_to_postgres(csv_file_path, table_name, connection_params, create_table=True, batch_size=100000):
+    """
+    Bulk upload processed data to PostgreSQL table using efficient COPY method.
+    A CSV file is streamed straight into COPY without being loaded into memory,
+    and PostgreSQL parses the values (including the 'time' timestamp) itself.
+    A parquet file is read by record batch and each batch is sent through COPY.
     
     Args:
-        csv_file_path (str): Path to the processed CSV file
+        csv_file_path (str): Path to the processed parquet or CSV file
         table_name (str): Name of the PostgreSQL table to insert into
         connection_params (dict): Database connection parameters
             {
@@ -60,16 +120,6 @@ def bulk_upload_to_postgres(csv_file_path, table_name, connection_params, create
     """
     
     try:
-        # Read the CSV file
-        print(f"Reading CSV file: {csv_file_path}")
-        df = pd.read_csv(csv_file_path)
-        
-        # Convert datetime columns properly
-        if 'time' in df.columns:
-            df['time'] = pd.to_datetime(df['time'])
-        
-        print(f"Loaded {len(df)} rows from CSV")
-        
         # Connect to PostgreSQL
         print("Connecting to PostgreSQL...")
         conn = psycopg2.connect(**connection_params)
@@ -98,26 +148,34 @@ def bulk_upload_to_postgres(csv_file_path, table_name, connection_params, create
         #     print(f"Table '{table_name}' created/verified")
         
         # Use COPY for efficient bulk insert
-        print("Starting bulk upload using COPY...")
-        
-        # Create a StringIO buffer
-        buffer = io.StringIO()
-        
-        # Write DataFrame to buffer as CSV
-        df.to_csv(buffer, index=False, header=False, sep='\t', na_rep='\\N')
-        buffer.seek(0)
+        print(f"Starting bulk upload of {csv_file_path} using COPY...")
         
-        # Use COPY to insert data
-        cursor.copy_from(
-            buffer,
-            table_name,
-            columns=df.columns.tolist(),
-            sep='\t',
-            null='\\N'
-        )
+        if is_parquet(csv_file_path):
+            uploaded_rows = 0
+            for df in read_chunks(csv_file_path, batch_size):
+                # Render the batch as CSV in memory and send it through COPY
+                buffer = io.StringIO()
+                df.to_csv(buffer, index=False, header=False)
+                buffer.seek(0)
+                cursor.copy_expert(
+                    f"COPY {table_name} ({', '.join(df.columns)}) FROM STDIN WITH (FORMAT csv)",
+                    buffer
+                )
+                uploaded_rows += cursor.rowcount
+        else:
+            with open(csv_file_path, 'r', newline='') as csv_file:
+                # The header row gives the column order of the file
+                columns = [column.strip() for column in csv_file.readline().strip().split(',')]
+                
+                # Stream the remaining rows from the file handle into COPY
+                cursor.copy_expert(
+                    f"COPY {table_name} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)",
+                    csv_file
+                )
+                uploaded_rows = cursor.rowcount
         
         conn.commit()
-        print(f"Successfully uploaded {len(df)} rows to table '{table_name}'")
+        print(f"Successfully uploaded {uploaded_rows} rows to table '{table_name}'")
         
         # Verify the upload
         cursor.execute(f"SELECT COUNT(*) FROM {table_name}")
@@ -143,13 +201,13 @@ def bulk_upload_to_postgres(csv_file_path, table_name, connection_params, create
             conn.close()
         return False
 
-def bulk_upload_batch_method(csv_file_path, table_name, connection_params, create_table=True, batch_size=10000):
+def bulk_upload_batch_method(csv_file_path, table_name, connection_params, create_table=True, batch_size=100000):
     """
-    Alternative bulk upload method using execute_batch for better control.
+    Alternative bulk upload method using execute_values for better control.
     Use this if the COPY method has issues with your specific data.
     
     Args:
-        csv_file_path (str): Path to the processed CSV file
+        csv_file_path (str): Path to the processed parquet or CSV file
         table_name (str): Name of the PostgreSQL table to insert into
         connection_params (dict): Database connection parameters
         create_table (bool): Whether to create the table if it doesn't exist
@@ -160,16 +218,6 @@ def bulk_upload_batch_method(csv_file_path, table_name, connection_params, creat
     """
     
     try:
-        # Read the CSV file
-        print(f"Reading CSV file: {csv_file_path}")
-        df = pd.read_csv(csv_file_path)
-        
-        # Convert datetime columns properly
-        if 'time' in df.columns:
-            df['time'] = pd.to_datetime(df['time'])
-        
-        print(f"Loaded {len(df)} rows from CSV")
-        
         # Connect to PostgreSQL
         print("Connecting to PostgreSQL...")
         conn = psycopg2.connect(**connection_params)
@@ -197,26 +245,30 @@ def bulk_upload_batch_method(csv_file_path, table_name, connection_params, creat
             conn.commit()
             print(f"Table '{table_name}' created/verified")
         
-        # Prepare insert statement
-        columns = df.columns.tolist()
-        placeholders = ', '.join(['%s'] * len(columns))
-        insert_sql = f"INSERT INTO {table_name} ({', '.join(columns)}) VALUES ({placeholders})"
-        
-        # Convert DataFrame to list of tuples
-        data_tuples = [tuple(row) for row in df.values]
+        # Read and upload the file in chunks of batch_size rows, in one transaction
+        print(f"Reading file in chunks of {batch_size} rows: {csv_file_path}")
+        total_rows = 0
         
-        # Upload in batches
-        total_rows = len(data_tuples)
-        uploaded_rows = 0
-        
-        for i in range(0, total_rows, batch_size):
-            batch = data_tuples[i:i + batch_size]
-            execute_batch(cursor, insert_sql, batch, page_size=batch_size)
-            uploaded_rows += len(batch)
+        for df in read_chunks(csv_file_path, batch_size):
+            # Convert datetime columns properly
+            if 'time' in df.columns:
+                df['time'] = pd.to_datetime(df['time'])
+            
+            # Prepare insert statement. execute_values expands the single VALUES %s
+            # placeholder into one multi-row INSERT per page of rows, each row rendered
+            # with the template's explicit casts so the server uses one typed path
+            columns = df.columns.tolist()
+            insert_sql = f"INSERT INTO {table_name} ({', '.join(columns)}) VALUES %s"
+            template = "(" + ", ".join(
+                f"%s::{COLUMN_CASTS[column]}" if column in COLUMN_CASTS else "%s" for column in columns
+            ) + ")"
             
-            # Show progress
-            progress = (uploaded_rows / total_rows) * 100
-            print(f"Progress: {uploaded_rows}/{total_rows} rows ({progress:.1f}%)")
+            # Stream rows as plain tuples instead of building an intermediate list
+            data_tuples = df.itertuples(index=False, name=None)
+            execute_values(cursor, insert_sql, data_tuples, template=template, page_size=5000)
+            
+            total_rows += len(df)
+            print(f"Progress: {total_rows} rows uploaded")
         
         conn.commit()
         print(f"Successfully uploaded {total_rows} rows to table '{table_name}'")
@@ -238,6 +290,88 @@ def bulk_upload_batch_method(csv_file_path, table_name, connection_params, creat
             conn.close()
         return False
 
+def bulk_upload_binary_method(csv_file_path, table_name, connection_params, create_table=True, batch_size=100000):
+    """
+    Bulk upload processed data to PostgreSQL table using binary COPY via pgcopy.
+    Values are packed in PostgreSQL's binary COPY format from their Python types,
+    so the server does not have to parse text. pgcopy only encodes Decimal values
+    into numeric columns, so prices are converted to Decimal before the copy.
+    
+    Args:
+        csv_file_path (str): Path to the processed parquet or CSV file
+        table_name (str): Name of the PostgreSQL table to insert into
+        connection_params (dict): Database connection parameters
+        create_table (bool): Whether to create the table if it doesn't exist
+        batch_size (int): Number of rows to process at once
+    
+    Returns:
+        bool: True if successful, False otherwise
+    """
+    
+    try:
+        # Connect to PostgreSQL
+        print("Connecting to PostgreSQL...")
+        conn = psycopg2.connect(**connection_params)
+        cursor = conn.cursor()
+        
+        # Create table if requested
+        if create_table:
+            create_table_sql = f"""
+            CREATE TABLE IF NOT EXISTS {table_name} (
+                trade_date VARCHAR(20),
+                trade_time TIME,
+                time TIMESTAMP,
+                symbol VARCHAR(10),
+                symbol_period VARCHAR(10),
+                open DECIMAL(15,2),
+                high DECIMAL(15,2),
+                low DECIMAL(15,2),
+                close DECIMAL(15,2),
+                volume INTEGER,
+                bid_volume INTEGER,
+                ask_volume INTEGER
+            );
+            """
+            cursor.execute(create_table_sql)
+            conn.commit()
+            print(f"Table '{table_name}' created/verified")
+        cursor.close()
+        
+        # Read and upload the file in chunks of batch_size rows, in one transaction
+        print(f"Starting bulk upload using binary COPY in chunks of {batch_size} rows...")
+        mgr = None
+        total_rows = 0
+        
+        for df in read_chunks(csv_file_path, batch_size):
+            # Binary COPY needs typed values matching the column types. trade_date is
+            # already text for its VARCHAR column and keeps the source value
+            df['time'] = pd.to_datetime(df['time'])
+            df['trade_time'] = df['time'].dt.time
+            for column in ('open', 'high', 'low', 'close'):
+                if column in df.columns:
+                    df[column] = [None if pd.isna(v) else Decimal(f"{v:.2f}") for v in df[column]]
+            
+            if mgr is None:
+                mgr = CopyManager(conn, table_name, df.columns.tolist())
+            mgr.copy(df.itertuples(index=False, name=None))
+            
+            total_rows += len(df)
+            print(f"Progress: {total_rows} rows uploaded")
+        
+        conn.commit()
+        print(f"Successfully uploaded {total_rows} rows to table '{table_name}'")
+        
+        conn.close()
+        
+        return True
+        
+    except Exception as e:
+        print(f"Error during bulk upload: {str(e)}")
+        if 'conn' in locals():
+            conn.rollback()
+            conn.close()
+        return False
+
 def main():
     """Example usage of the bulk upload functions"""
     
@@ -251,7 +385,7 @@ def main():
     }
     
     # Get file path and table name from user
-    csv_file = r"C:\auxDrive\SierraChart2\Data\MESH5.CME_ticks_processed.csv" # input("Enter path to your processed CSV file: ").strip()
+    csv_file = r"C:\auxDrive\SierraChart2\Data\MESH5.CME_ticks_processed.parquet" # input("Enter path to your processed parquet or CSV file: ").strip()
     table_name = "market_data" #input("Enter PostgreSQL table name: ").strip()
     
     # Remove quotes if present
@@ -272,11 +406,14 @@ def main():
     print("\nChoose upload method:")
     print("1. COPY method (faster, recommended)")
     print("2. Batch insert method (more compatible)")
-    method = '1' # input("Enter choice (1 or 2): ").strip()
+    print("3. Binary COPY method (fastest for numeric columns, requires pgcopy)")
+    method = '1' # input("Enter choice (1, 2 or 3): ").strip()
     
     # Perform upload
     if method == '2':
         success = bulk_upload_batch_method(csv_file, table_name, connection_params)
+    elif method == '3':
+        success = bulk_upload_binary_method(csv_file, table_name, connection_params)
     else:
         success = bulk_upload_to_postgres(csv_file, table_name, connection_params)
     
@@ -10,7 +10,8 @@ Usage:
     python3 2_deleteLowVolSourcesByDay.py --start-date YYYY-MM-DD --symbol SYMBOL [OPTIONS]
 
 Arguments:
-    --symbol        : Symbol to process (e.g., 'SPY'). (Required)
+    --symbol        : (optional) Symbol to process (e.g., 'SPY'). If not provided, all symbols are processed
+                      together from a single aggregated query.
     --start-date    : (optional) First date to process (YYYY-MM-DD). Will default to the earliest date for the symbol in the database.
     --end-date      : (optional) Last date to process (YYYY-MM-DD). Defaults to yesterday.
     --delete        : (optional) Delete trades belonging to the lowest-volume source each day.
@@ -21,16 +22,21 @@ Example:
 
 """
 
+import io
+import math
 import os
 import sys
 import argparse
 import psycopg2
-from psycopg2.extras import execute_values
+from itertools import groupby
+from operator import itemgetter
 from datetime import datetime, date, timedelta
 from dotenv import load_dotenv
 
 load_dotenv() # Load environment variables from .env file
 
+DELETE_BATCH_DAYS = 500 # Days of queued deletes sent and committed together
+
 def parse_args():
     p = argparse.ArgumentParser(
         description="Track daily volumes by source and delete the lowest-volume source's trades."
@@ -92,81 +98,124 @@ def ensure_index_and_table(conn):
     # conn.commit()
 
 
-def date_range(start: date, end: date):
-    current = start
-    while current <= end:
-        yield current
-        current += timedelta(days=1)
+def prepare_statements(conn):
+    """
+    Creates the session's delete staging table and prepares the delete statement that runs
+    once per delete batch, so Postgres parses and plans it only once per connection.
+    """
+    with conn.cursor() as cur:
+        # Staging table for the delete batches, with the same column types as market_data.
+        # It lives for the whole session and is emptied by every commit
+        cur.execute("""
+            CREATE TEMP TABLE to_delete ON COMMIT DELETE ROWS AS
+            SELECT trade_date, symbol, symbol_period FROM market_data WITH NO DATA;
+        """)
+        cur.execute("""
+            PREPARE delete_staged AS
+            DELETE FROM market_data m
+             USING to_delete d
+             WHERE m.trade_date = d.trade_date
+               AND m.symbol = d.symbol
+               AND m.symbol_period = d.symbol_period;
+        """)
+    conn.commit()
 
 
-def get_earliest_date_for_symbol(conn, symbol: str) -> date | None:
-    print(f"Determining earliest date for symbol {symbol}. This might take a few minutes depending on size of dataset...")
+def get_earliest_date_for_symbol(conn, symbol: str | None) -> date | None:
+    # With no symbol, the earliest date across all symbols is returned
+    print(f"Determining earliest date for {f'symbol {symbol}' if symbol else 'all symbols'}. This might take a few minutes depending on size of dataset...")
     with conn.cursor() as cur:
-        cur.execute("""
-            SELECT MIN(time_bucket)
-            FROM one_day_candle
-            WHERE symbol = %s;
-        """, (symbol,))
+        if symbol:
+            cur.execute("""
+                SELECT MIN(time_bucket)
+                FROM one_day_candle
+                WHERE symbol = %s;
+            """, (symbol,))
+        else:
+            cur.execute("""
+                SELECT MIN(time_bucket)
+                FROM one_day_candle;
+            """)
         result = cur.fetchone()
         if result and result[0]:
             return result[0]
         return None
 
 
-def get_all_symbols(conn) -> list[str]:
-    print("Querying database for all available symbols...")
+def delete_sources(conn, pending_deletes: list, dry_run: bool = False):
+    """Deletes the queued (trade_date, symbol, symbol_period) rows in one statement and commits."""
+    print(f"    → Deleting trades for {len(pending_deletes)} day/source pair(s)...")
+    if dry_run:
+        print("    → Dry run: no rows deleted.")
+        return
     with conn.cursor() as cur:
-        cur.execute("""
-            SELECT DISTINCT symbol
-            FROM market_data
-            ORDER BY symbol;
-        """)
-        return [row[0] for row in cur.fetchall()]
-
-
-def process_day(conn, day: date, symbol: str, delete: bool = False, dry_run: bool = False):
-    day_str = day.isoformat()
-    with conn.cursor() as cur:
-        # 1) Sum volumes per source
-        cur.execute("""
-            SELECT symbol_period, SUM(volume) as total_volume
+        # COPY the pairs into the session's staging table, then delete with the prepared
+        # single join that Postgres can run as a hash join
+        tsv_data = "".join(f"{trade_date}\t{symbol}\t{src}\n" for trade_date, symbol, src in pending_deletes)
+        cur.copy_from(io.StringIO(tsv_data), 'to_delete', columns=('trade_date', 'symbol', 'symbol_period'))
+        cur.execute("EXECUTE delete_staged;")
+        deleted = cur.rowcount
+    conn.commit()
+    print(f"    → Deleted {deleted} rows.")
+
+
+def process_range(conn, start: date, end: date, symbol: str | None, delete: bool = False, dry_run: bool = False):
+    # With no symbol, every symbol is processed from the same single query
+    start_str, end_str = start.isoformat(), end.isoformat()
+    pending_deletes = []
+    pending_days = 0
+    symbol_filter = "AND symbol = %s" if symbol else ""
+    params = (start_str, end_str, symbol) if symbol else (start_str, end_str)
+    found = False
+    # 1) Sum volumes per symbol, day and source for the whole range in one query, streamed
+    # from a server-side cursor instead of one round-trip per day. The cursor is WITH HOLD,
+    # so the commits of the delete batches below do not close it while it is being read
+    with conn.cursor(name="dedup", withhold=True) as cur:
+        cur.itersize = 10_000
+        cur.execute(f"""
+            SELECT symbol, trade_date, symbol_period, SUM(volume) as total_volume
               FROM market_data
-             WHERE trade_date = %s AND symbol = %s
-             GROUP BY symbol_period
-             ORDER BY symbol_period;
-        """, (day_str, symbol))
-        rows = cur.fetchall()
-        if not rows:
-            print(f"[{day_str}] No trades found for symbol {symbol}.")
-            return
-
-        # Log volumes
-        print(f"[{day_str}] Volume by source for {symbol}:")
-        for src, vol in rows:
-            print(f"    {src:10s} → {vol}")
-
-        # 3) Find minimum-volume source(s)
-        min_vol = min(vol for _, vol in rows)
-        min_sources = [src for src, vol in rows if vol == min_vol]
-        print(f"    Lowest volume = {min_vol} from source(s): {', '.join(min_sources)}")
-
-        # 4) Delete trades if requested
-        if delete and len(rows) >= 2:
-            placeholders = ", ".join(["%s"] * len(min_sources))
-            del_sql = f"""
-                DELETE FROM market_data
-                 WHERE trade_date = %s AND symbol = %s
-                   AND symbol_period IN ({placeholders});
-            """
-            params = [day_str, symbol] + min_sources
-            print(f"    → Deleting trades for {len(min_sources)} source(s)...")
-            if not dry_run:
-                cur.execute(del_sql, params)
-                deleted = cur.rowcount
-                conn.commit()
-                print(f"    → Deleted {deleted} rows.")
-            else:
-                print("    → Dry run: no rows deleted.")
+             WHERE trade_date BETWEEN %s AND %s {symbol_filter}
+             GROUP BY symbol, trade_date, symbol_period
+             ORDER BY symbol, trade_date, symbol_period;
+        """, params)
+
+        # 2) Each day's rows are contiguous, so only one day is held in memory at a time
+        for (day_symbol, trade_date), day_rows in groupby(cur, key=itemgetter(0, 1)):
+            found = True
+            rows = [(src, vol) for _, _, src, vol in day_rows]
+            day_str = str(trade_date)
+
+            # Log volumes
+            print(f"[{day_str}] Volume by source for {day_symbol}:")
+            for src, vol in rows:
+                print(f"    {src:10s} → {vol}")
+
+            # 3) Find minimum-volume source(s) in one pass
+            min_vol = math.inf
+            min_sources = []
+            for src, vol in rows:
+                if vol < min_vol:
+                    min_vol, min_sources = vol, [src]
+                elif vol == min_vol:
+                    min_sources.append(src)
+            print(f"    Lowest volume = {min_vol} from source(s): {', '.join(min_sources)}")
+
+            # 4) Queue trades for deletion if requested, flushing every DELETE_BATCH_DAYS days
+            if delete and len(rows) >= 2:
+                pending_deletes.extend((trade_date, day_symbol, src) for src in min_sources)
+                pending_days += 1
+                if pending_days >= DELETE_BATCH_DAYS:
+                    delete_sources(conn, pending_deletes, dry_run)
+                    pending_deletes, pending_days = [], 0
+
+    if not found:
+        print(f"[{start_str} - {end_str}] No trades found for {f'symbol {symbol}' if symbol else 'any symbol'}.")
+        return
+
+    # 5) Delete whatever is left in the last batch
+    if pending_deletes:
+        delete_sources(conn, pending_deletes, dry_run)
 
 
 def main():
@@ -174,14 +223,10 @@ def main():
 
     conn = connect_db(args)
     ensure_index_and_table(conn)
+    prepare_statements(conn)
 
-    symbols_to_process = []
-    if args.symbol:
-        symbols_to_process.append(args.symbol)
-    else:
-        symbols_to_process = get_all_symbols(conn)
-        if not symbols_to_process:
-            sys.exit("Error: No symbols found in the database to process.")
+    # Without --symbol all symbols are processed together in one pass
+    symbols_to_process = [args.symbol] if args.symbol else [None]
 
     # Determine end date once
     if args.end_date:
@@ -193,7 +238,7 @@ def main():
         end = date.today() - timedelta(days=1)
 
     for current_symbol in symbols_to_process:
-        print(f"\n--- Processing symbol: {current_symbol} ---")
+        print(f"\n--- Processing symbol: {current_symbol or 'all symbols'} ---")
         # Determine start date for the current symbol
         if args.start_date:
             try:
@@ -203,20 +248,19 @@ def main():
         else:
             start = get_earliest_date_for_symbol(conn, current_symbol)
             if not start:
-                print(f"Warning: No data found for symbol {current_symbol} to determine start date. Skipping.")
+                print(f"Warning: No data found for symbol {current_symbol or 'all symbols'} to determine start date. Skipping.")
                 continue # Skip to next symbol if no data
-            print(f"Using earliest date for {current_symbol}: {start.isoformat()}")
+            print(f"Using earliest date for {current_symbol or 'all symbols'}: {start.isoformat()}")
 
         if start > end:
-            print(f"Warning: Start date {start} is after end date {end} for symbol {current_symbol}. Skipping.")
+            print(f"Warning: Start date {start} is after end date {end} for symbol {current_symbol or 'all symbols'}. Skipping.")
             continue # Skip to next symbol if start date is after end date
 
-        for day in date_range(start, end):
-            try:
-                process_day(conn, day, current_symbol, args.delete, args.dry_run)
-            except Exception as e:
-                conn.rollback()
-                print(f"[{day.isoformat()}] ERROR for {current_symbol}: {e}")
+        try:
+            process_range(conn, start, end, current_symbol, args.delete, args.dry_run)
+        except Exception as e:
+            conn.rollback()
+            print(f"[{start.isoformat()} - {end.isoformat()}] ERROR for {current_symbol or 'all symbols'}: {e}")
     conn.close()
 
 
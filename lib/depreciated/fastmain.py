@@ -2,22 +2,46 @@
 This script consolidates futures contract data from multiple daily or monthly CSV/TXT files into a single continuous contract.
 It identifies the file with the highest trading volume for each day within a specified date range and combines the data chronologically.
 The script optimizes performance by pre-calculating daily volumes and grouping data by date.
-It generates a consolidated CSV output and a detailed log file summarizing the consolidation process, including file usage and daily breakdowns.
-"""
-"""
-This script consolidates futures contract data from multiple daily or monthly CSV/TXT files into a single continuous contract.
-It identifies the file with the highest trading volume for each day within a specified date range and combines the data chronologically.
-The script optimizes performance by pre-calculating daily volumes and grouping data by date.
+Parsed files are cached as a .parquet file beside each input and reused while the input is unchanged.
 It generates a consolidated CSV output and a detailed log file summarizing the consolidation process, including file usage and daily breakdowns.
 """
 
 import pandas as pd
+import numpy as np
+import pyarrow as pa
+import pyarrow.csv as pcsv
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+import duckdb
 import os
 import glob
-from datetime import datetime, timedelta
-from collections import defaultdict
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, date, timedelta
+from collections import defaultdict, Counter
 import argparse
 
+# Column layout of the input files, in file order, with the types parsed by the Arrow CSV reader
+COLUMN_TYPES = {
+    'Date': pa.timestamp('s'),
+    'Time': pa.string(),
+    'Open': pa.float32(),
+    'High': pa.float32(),
+    'Low': pa.float32(),
+    'Last': pa.float32(),
+    'Volume': pa.int32(),
+    'NumberOfTrades': pa.int32(),
+    'BidVolume': pa.int32(),
+    'AskVolume': pa.int32()
+}
+
+# Columns used for consolidation. The others are skipped by the reader without being converted
+USED_COLUMNS = ['Date', 'Time', 'Open', 'High', 'Low', 'Last', 'Volume', 'NumberOfTrades']
+
+# Daily volumes are keyed by days since this date
+EPOCH = date(1970, 1, 1)
+
 def parse_arguments():
     """Parse command line arguments"""
     parser = argparse.ArgumentParser(description='Consolidate futures contract data files')
@@ -25,6 +49,8 @@ def parse_arguments():
                         help='Path to folder containing input text files')
     parser.add_argument('--output_folder', '-o', type=str, default='.',
                         help='Path to output folder (default: current directory)')
+    parser.add_argument('--duckdb', action='store_true',
+                        help='Run the whole consolidation as a single DuckDB query')
     return parser.parse_args()
 
 def load_data_files(input_folder):
@@ -45,63 +71,150 @@ def load_data_files(input_folder):
     
     return all_files
 
+def get_cache_path(file_path):
+    """Path of the parquet cache kept beside a data file"""
+    return file_path + '.parquet'
+
 def load_and_parse_file(file_path):
-    """Load and parse a single data file with optimizations"""
+    """
+    Load and parse a single data file into an Arrow table.
+    The parsed table is cached as parquet beside the file and reused on later runs
+    while the cache is at least as new as the file.
+    """
     try:
+        cache_path = get_cache_path(file_path)
+        if os.path.exists(cache_path) and os.path.getmtime(cache_path) >= os.path.getmtime(file_path):
+            print(f"Loading {os.path.basename(file_path)} from cache...")
+            return pq.read_table(cache_path)
+        
         print(f"Loading {os.path.basename(file_path)}...")
         
-        # Read CSV with optimized parameters
-        df = pd.read_csv(
+        # Read CSV with the multithreaded Arrow reader, specialized on the fixed column layout:
+        # the header is replaced by the known names, every column has a fixed type so no type
+        # inference runs, and unused columns are not converted at all
+        table = pcsv.read_csv(
             file_path,
-            sep=',',
-            dtype={
-                'Open': 'float32',
-                'High': 'float32', 
-                'Low': 'float32',
-                'Last': 'float32',
-                'Volume': 'int32',
-                'NumberOfTrades': 'int32',
-                'BidVolume': 'int32',
-                'AskVolume': 'int32'
-            },
-            parse_dates=['Date']
+            read_options=pcsv.ReadOptions(block_size=64 << 20, column_names=list(COLUMN_TYPES), skip_rows=1),
+            convert_options=pcsv.ConvertOptions(
+                column_types=COLUMN_TYPES,
+                include_columns=USED_COLUMNS,
+                timestamp_parsers=[pcsv.ISO8601, '%Y/%m/%d']
+            )
         )
         
-        # Clean column names
-        df.columns = df.columns.str.strip()
+        # Keep every day's rows contiguous. The sort is stable, so rows within a day keep their order
+        table = table.sort_by('Date')
+        
+        # Cache the typed columns so later runs skip CSV parsing
+        pq.write_table(table, cache_path, compression='snappy')
         
-        return df
+        return table
     
     except Exception as e:
         print(f"Error loading {file_path}: {str(e)}")
         return None
 
-def calculate_daily_volumes(loaded_files):
-    """Pre-calculate daily volume summaries for all files"""
-    print("\nCalculating daily volume summaries...")
+def calculate_daily_volumes(table):
+    """
+    Calculate the daily volume summary of one Date-sorted file in a single pass.
+    Returns an int64 array with one (days since EPOCH, start_row, end_row, total_volume)
+    row per day, so each day's rows can later be sliced out by position.
+    """
+    if table.num_rows == 0:
+        return np.empty((0, 4), dtype=np.int64)
     
-    daily_volumes = {}  # {file_path: {date: total_volume}}
-    
-    for file_path, df in loaded_files.items():
-        print(f"Processing daily volumes for {os.path.basename(file_path)}...")
-        
-        # Group by date and sum volume - much faster than filtering each day
-        daily_vol = df.groupby(df['Date'].dt.date)['Volume'].sum()
-        daily_volumes[file_path] = daily_vol.to_dict()
+    # Find where the day changes, then sum volume between the boundaries with one reduceat
+    days = pc.cast(pc.cast(table['Date'], pa.date32(), safe=False), pa.int32()).to_numpy().astype(np.int64)
+    changes = np.flatnonzero(np.diff(days)) + 1
+    starts = np.r_[0, changes]
+    ends = np.r_[changes, len(days)]
+    volumes = np.add.reduceat(table['Volume'].to_numpy().astype(np.int64), starts)
+    return np.column_stack([days[starts], starts, ends, volumes])
+
+def load_file_worker(file_path):
+    """
+    Load one data file in a worker process and compute its daily volumes.
+    The parsed table stays in its parquet cache rather than being sent back,
+    since large tables are slow to pass between processes.
+    Returns (file_path, daily_volumes, cache_path), with None values if loading failed.
+    """
+    table = load_and_parse_file(file_path)
+    if table is None:
+        return file_path, None, None
     
-    return daily_volumes
+    print(f"Processing daily volumes for {os.path.basename(file_path)}...")
+    return file_path, calculate_daily_volumes(table), get_cache_path(file_path)
 
 def get_date_range_from_daily_volumes(daily_volumes):
     """Get overall date range from daily volume summaries"""
-    all_dates = set()
-    
-    for file_volumes in daily_volumes.values():
-        all_dates.update(file_volumes.keys())
+    all_days = [file_volumes[:, 0] for file_volumes in daily_volumes.values() if len(file_volumes)]
     
-    if not all_dates:
+    if not all_days:
         raise ValueError("No dates found in any files")
     
-    return min(all_dates), max(all_dates)
+    all_days = np.concatenate(all_days)
+    return EPOCH + timedelta(days=int(all_days.min())), EPOCH + timedelta(days=int(all_days.max()))
+
+def pick_best_files(file_paths, daily_volumes, start_date, end_date):
+    """
+    Pick the highest-volume file for every day from start_date to end_date.
+    Returns the index into file_paths and the volume of the best file per day,
+    taken with one argmax over a dense (files x days) volume matrix.
+    """
+    start_day = (start_date - EPOCH).days
+    total_days = (end_date - start_date).days + 1
+    
+    vols = np.zeros((len(file_paths), total_days), dtype=np.int64)
+    for i, file_path in enumerate(file_paths):
+        file_volumes = daily_volumes[file_path]
+        vols[i, file_volumes[:, 0] - start_day] = file_volumes[:, 3]
+    
+    # argmax returns the first file on ties, same as a strict greater-than scan
+    return vols.argmax(axis=0), vols.max(axis=0)
+
+def log_day(breakdown, file_usage, totals, date_str, file, volume, trades):
+    """Write one line of the daily breakdown and update the running usage summary"""
+    breakdown.write(f"{date_str}\t{file:<25}\t{volume:<12,}\t{trades:,}\n")
+    if file != 'NO_DATA':
+        file_usage[file] += 1
+        totals['volume'] += volume
+        totals['trades'] += trades
+
+def write_log_file(log_path, input_folder, start_date, end_date, total_records, files_processed, file_usage, totals, breakdown):
+    """
+    Write the consolidation log with the file usage summary, followed by the daily breakdown
+    that was streamed to the breakdown file while processing. The breakdown file is closed.
+    """
+    with open(log_path, 'w') as f:
+        f.write(f"Futures Contract Data Consolidation Log\n")
+        f.write(f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
+        f.write(f"Input folder: {input_folder}\n")
+        f.write(f"Start date: {start_date.strftime('%Y-%m-%d')}\n")
+        f.write(f"End date: {end_date.strftime('%Y-%m-%d')}\n")
+        f.write(f"Total records: {total_records:,}\n")
+        f.write(f"Files processed: {files_processed}\n\n")
+        
+        f.write("File Usage Summary:\n")
+        f.write("-" * 30 + "\n")
+        for file, days in sorted(file_usage.items()):
+            f.write(f"{file}: {days} days\n")
+        
+        f.write(f"\nTotal Volume: {totals['volume']:,}\n")
+        f.write(f"Total Trades: {totals['trades']:,}\n\n")
+        
+        f.write("Daily breakdown:\n")
+        f.write("Date\t\tFile Used\t\tVolume\t\tTrades\n")
+        f.write("-" * 70 + "\n")
+        
+        breakdown.seek(0)
+        shutil.copyfileobj(breakdown, f)
+    breakdown.close()
+
+def format_float_column(column):
+    """Format a float column as text the way pandas writes it: shortest repr, with '.0' kept on whole numbers"""
+    text = pc.cast(column, pa.string())
+    whole = pc.invert(pc.match_substring_regex(text, r'[.eEn]'))
+    return pc.if_else(whole, pc.binary_join_element_wise(text, '.0', ''), text)
 
 def consolidate_data(input_folder, output_folder):
     """Main function to consolidate the data"""
@@ -109,82 +222,77 @@ def consolidate_data(input_folder, output_folder):
     # Load all data files
     data_files = load_data_files(input_folder)
     
-    # Load all files into memory once
-    print(f"\nLoading all data files into memory...")
-    loaded_files = {}
-    for file_path in data_files:
-        df = load_and_parse_file(file_path)
-        if df is not None:
-            loaded_files[file_path] = df
-        else:
-            print(f"Failed to load {file_path}")
+    # Parse the files and calculate their daily volume summaries in parallel, one process per file
+    print(f"\nLoading all data files and calculating daily volume summaries...")
+    loaded_files = {}  # {file_path: cache_path}
+    daily_volumes = {}  # {file_path: array of (day, start_row, end_row, total_volume)}
+    with ProcessPoolExecutor(max_workers=min(len(data_files), os.cpu_count() or 1)) as executor:
+        for file_path, file_volumes, cache_path in executor.map(load_file_worker, data_files):
+            if cache_path is not None:
+                loaded_files[file_path] = cache_path
+                daily_volumes[file_path] = file_volumes
+            else:
+                print(f"Failed to load {file_path}")
     
     print(f"Successfully loaded {len(loaded_files)} files")
     
-    # Pre-calculate daily volume summaries
-    daily_volumes = calculate_daily_volumes(loaded_files)
-    
     # Get date range from daily summaries
     start_date, end_date = get_date_range_from_daily_volumes(daily_volumes)
     print(f"\nDate range: {start_date.strftime('%Y-%m-%d')} to {end_date.strftime('%Y-%m-%d')}")
     
-    # Pre-group data by date for faster filtering
-    print("Pre-grouping data by date for faster processing...")
-    grouped_data = {}  # {file_path: {date: DataFrame}}
+    # Pick the best file for every day up front
+    file_paths = list(loaded_files.keys())
+    best_indices, best_volumes = pick_best_files(file_paths, daily_volumes, start_date, end_date)
+    
+    # Read back the files that are the best file on at least one day. Their rows are
+    # sliced by the row ranges from the daily summaries, so no second grouping pass is needed
+    print("Reading the selected files back from their cache...")
+    day_slices = {}  # {file_path: (DataFrame, {days since EPOCH: (start_row, end_row)})}
+    used_indices = np.unique(best_indices[best_volumes > 0])
     
-    for file_path, df in loaded_files.items():
-        print(f"Grouping {os.path.basename(file_path)} by date...")
-        grouped = df.groupby(df['Date'].dt.date)
-        grouped_data[file_path] = {date: group for date, group in grouped}
+    for file_path in (file_paths[i] for i in used_indices):
+        print(f"Reading {os.path.basename(file_path)}...")
+        # Keep the columns Arrow-backed, so slicing, concat and the CSV writer work on Arrow buffers
+        df = pq.read_table(loaded_files[file_path], memory_map=True).to_pandas(types_mapper=pd.ArrowDtype)
+        ranges = {int(day): (int(start), int(end)) for day, start, end, _ in daily_volumes[file_path]}
+        day_slices[file_path] = (df, ranges)
     
-    # Initialize results
+    # Initialize results. The daily breakdown is streamed to a temporary file and the
+    # usage summary is accumulated as the days are processed
     consolidated_data = []
-    log_entries = []
+    breakdown = tempfile.TemporaryFile('w+')
+    file_usage = Counter()
+    totals = Counter()
     
     # Process each day using pre-calculated summaries
-    current_date = start_date
+    start_day = (start_date - EPOCH).days
     total_days = (end_date - start_date).days + 1
     processed_days = 0
     
-    while current_date <= end_date:
+    for current_day in range(start_day, start_day + total_days):
         processed_days += 1
-        date_str = current_date.strftime('%Y-%m-%d')
+        date_str = (EPOCH + timedelta(days=current_day)).strftime('%Y-%m-%d')
         
         if processed_days % 10 == 0:  # Progress update every 10 days
             print(f"Processing day {processed_days}/{total_days}: {date_str}")
         
-        best_file = None
-        best_volume = 0
         best_data = None
         
-        # Use pre-calculated daily volumes to find best file
-        for file_path in loaded_files.keys():
-            volume = daily_volumes[file_path].get(current_date, 0)
-            
-            if volume > best_volume:
-                best_volume = volume
-                best_file = file_path
+        # Days where no file has any volume have no best file
+        best_volume = int(best_volumes[processed_days - 1])
+        best_file = file_paths[best_indices[processed_days - 1]] if best_volume > 0 else None
         
         # Get the actual data for the best file/date combination
-        if best_file and current_date in grouped_data[best_file]:
-            best_data = grouped_data[best_file][current_date].copy()
+        if best_file and current_day in day_slices[best_file][1]:
+            # A positional slice is a view, the rows are copied once by the final concat
+            df, ranges = day_slices[best_file]
+            start, end = ranges[current_day]
+            best_data = df.iloc[start:end]
             
             consolidated_data.append(best_data)
-            log_entries.append({
-                'date': date_str,
-                'file': os.path.basename(best_file),
-                'volume': best_volume,
-                'trades': len(best_data)
-            })
+            log_day(breakdown, file_usage, totals, date_str, os.path.basename(best_file), best_volume, len(best_data))
         else:
-            log_entries.append({
-                'date': date_str,
-                'file': 'NO_DATA',
-                'volume': 0,
-                'trades': 0
-            })
-        
-        current_date += timedelta(days=1)
+            log_day(breakdown, file_usage, totals, date_str, 'NO_DATA', 0, 0)
     
     # Combine all data
     if consolidated_data:
@@ -206,7 +314,14 @@ def consolidate_data(input_folder, output_folder):
         output_columns = ['Date', 'Time', 'Open', 'High', 'Low', 'Last', 'Volume', 'NumberOfTrades']
         final_df = final_df[output_columns]
         
-        final_df.to_csv(output_path, index=False)
+        # Format the CSV with Arrow's multithreaded writer, in the layout pandas' to_csv produced:
+        # Date as a plain date, prices keeping their '.0', and no quoting of the header or Time
+        table = pa.Table.from_pandas(final_df, preserve_index=False)
+        table = table.set_column(0, 'Date', pc.cast(table['Date'], pa.date32(), safe=False))
+        for column in ['Open', 'High', 'Low', 'Last']:
+            index = table.schema.get_field_index(column)
+            table = table.set_column(index, column, format_float_column(table[column]))
+        pcsv.write_csv(table, output_path, write_options=pcsv.WriteOptions(include_header=True, batch_size=65536, quoting_style='none', quoting_header='none'))
         print(f"Consolidated data saved to: {output_path}")
         print(f"Total records: {len(final_df):,}")
         
@@ -214,47 +329,109 @@ def consolidate_data(input_folder, output_folder):
         log_filename = f"continuous_contract_log_{current_datetime}.txt"
         log_path = os.path.join(output_folder, log_filename)
         
-        with open(log_path, 'w') as f:
-            f.write(f"Futures Contract Data Consolidation Log\n")
-            f.write(f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-            f.write(f"Input folder: {input_folder}\n")
-            f.write(f"Start date: {start_date.strftime('%Y-%m-%d')}\n")
-            f.write(f"End date: {end_date.strftime('%Y-%m-%d')}\n")
-            f.write(f"Total records: {len(final_df):,}\n")
-            f.write(f"Files processed: {len(loaded_files)}\n\n")
-            
-            # Summary statistics
-            file_usage = {}
-            total_volume = 0
-            total_trades = 0
-            
-            for entry in log_entries:
-                if entry['file'] != 'NO_DATA':
-                    file_usage[entry['file']] = file_usage.get(entry['file'], 0) + 1
-                    total_volume += entry['volume']
-                    total_trades += entry['trades']
-            
-            f.write("File Usage Summary:\n")
-            f.write("-" * 30 + "\n")
-            for file, days in sorted(file_usage.items()):
-                f.write(f"{file}: {days} days\n")
-            
-            f.write(f"\nTotal Volume: {total_volume:,}\n")
-            f.write(f"Total Trades: {total_trades:,}\n\n")
-            
-            f.write("Daily breakdown:\n")
-            f.write("Date\t\tFile Used\t\tVolume\t\tTrades\n")
-            f.write("-" * 70 + "\n")
-            
-            for entry in log_entries:
-                f.write(f"{entry['date']}\t{entry['file']:<25}\t{entry['volume']:<12,}\t{entry['trades']:,}\n")
+        write_log_file(log_path, input_folder, start_date, end_date, len(final_df), len(loaded_files),
+                       file_usage, totals, breakdown)
         
         print(f"Log file saved to: {log_path}")
         return output_path, log_path
     
     else:
+        breakdown.close()
+        print("No data found to consolidate!")
+        return None, None
+
+def consolidate_data_duckdb(input_folder, output_folder):
+    """Consolidate the data with DuckDB: pick the highest-volume file per day and copy its rows out in one query"""
+    
+    data_files = load_data_files(input_folder)
+    files_list = "[" + ", ".join("'" + path.replace("'", "''") + "'" for path in data_files) + "]"
+    # Columns are read as text and given the loader's types explicitly, so Time keeps its
+    # original text and the output has the same layout as the pandas path
+    source = f"read_csv({files_list}, filename=true, union_by_name=true, all_varchar=true)"
+    column_types = {'Date': 'DATE', 'Open': 'REAL', 'High': 'REAL', 'Low': 'REAL', 'Last': 'REAL',
+                    'Volume': 'INTEGER', 'NumberOfTrades': 'INTEGER', 'BidVolume': 'INTEGER', 'AskVolume': 'INTEGER'}
+    
+    con = duckdb.connect()
+    
+    # Headers after the first one may carry a leading space, so expose them under clean names
+    raw_columns = [row[0] for row in con.execute(f"DESCRIBE SELECT * FROM {source}").fetchall()]
+    columns = ", ".join(
+        f'CAST("{column}" AS {column_types[column.strip()]}) AS "{column.strip()}"' if column.strip() in column_types
+        else f'"{column}" AS "{column.strip()}"'
+        for column in raw_columns
+    )
+    # Loaded into a table rather than a view: insertion order is preserved, so each row's rowid follows
+    # its line position in its file, and rows sharing a Date and Time keep their original order
+    con.execute(f"CREATE TEMP TABLE ticks AS SELECT {columns} FROM {source}")
+    
+    # Position of every file in data_files, so volume ties go to the first file like in the pandas path
+    con.execute("CREATE TEMP TABLE files (filename VARCHAR, file_index INTEGER)")
+    con.executemany("INSERT INTO files VALUES (?, ?)", [(path, i) for i, path in enumerate(data_files)])
+    
+    # Winning file per day, by total volume. One whole row is picked per day, so best and trades always come from the same file
+    print("Calculating daily volumes and picking the best file per day...")
+    con.execute("""
+        CREATE TEMP TABLE winners AS
+        WITH daily AS (
+            SELECT filename, CAST("Date" AS DATE) AS d, SUM(Volume) AS vol, COUNT(*) AS trades
+            FROM ticks
+            GROUP BY filename, d
+        )
+        SELECT d, filename AS best, vol, trades
+        FROM daily
+        JOIN files USING (filename)
+        WHERE vol > 0
+        QUALIFY row_number() OVER (PARTITION BY d ORDER BY vol DESC, file_index) = 1
+    """)
+    winners = {d: (best, vol, trades) for d, best, vol, trades in con.execute("SELECT * FROM winners ORDER BY d").fetchall()}
+    
+    if not winners:
         print("No data found to consolidate!")
         return None, None
+    
+    start_date, end_date = min(winners), max(winners)
+    print(f"\nDate range: {start_date.strftime('%Y-%m-%d')} to {end_date.strftime('%Y-%m-%d')}")
+    
+    # Every calendar day gets a log entry, days without a winner are logged as NO_DATA
+    breakdown = tempfile.TemporaryFile('w+')
+    file_usage = Counter()
+    totals = Counter()
+    current_date = start_date
+    while current_date <= end_date:
+        best, vol, trades = winners.get(current_date, ('NO_DATA', 0, 0))
+        log_day(breakdown, file_usage, totals, current_date.strftime('%Y-%m-%d'),
+                os.path.basename(best) if best != 'NO_DATA' else best, vol, trades)
+        current_date += timedelta(days=1)
+    
+    # Save consolidated data, written by DuckDB straight from the join
+    current_datetime = datetime.now().strftime('%Y%m%d_%H%M%S')
+    output_filename = f"continuous_contract_{current_datetime}.csv"
+    output_path = os.path.join(output_folder, output_filename)
+    
+    print(f"Saving consolidated data...")
+    output_columns = ", ".join(f't."{column}"' for column in ['Date', 'Time', 'Open', 'High', 'Low', 'Last', 'Volume', 'NumberOfTrades'])
+    con.execute(f"""
+        COPY (
+            SELECT {output_columns}
+            FROM ticks t
+            JOIN winners w ON w.d = CAST(t."Date" AS DATE) AND w.best = t.filename
+            ORDER BY t."Date", t.rowid
+        ) TO '{output_path.replace("'", "''")}' (HEADER)
+    """)
+    total_records = totals['trades']
+    con.close()
+    print(f"Consolidated data saved to: {output_path}")
+    print(f"Total records: {total_records:,}")
+    
+    # Save log file
+    log_filename = f"continuous_contract_log_{current_datetime}.txt"
+    log_path = os.path.join(output_folder, log_filename)
+    
+    write_log_file(log_path, input_folder, start_date, end_date, total_records, len(data_files),
+                   file_usage, totals, breakdown)
+    
+    print(f"Log file saved to: {log_path}")
+    return output_path, log_path
 
 def main():
     """Main entry point"""
@@ -273,7 +450,10 @@ def main():
         print(f"Output folder: {args.output_folder}")
         
         start_time = datetime.now()
-        output_file, log_file = consolidate_data(args.input_folder, args.output_folder)
+        if args.duckdb:
+            output_file, log_file = consolidate_data_duckdb(args.input_folder, args.output_folder)
+        else:
+            output_file, log_file = consolidate_data(args.input_folder, args.output_folder)
         end_time = datetime.now()
         
         if output_file:
@@ -6,6 +6,7 @@ The consolidated data is then saved to a new CSV file, and a detailed log file i
 documenting the daily selection process and overall consolidation summary.
 """
 import pandas as pd
+import numpy as np
 import os
 import glob
 from datetime import datetime, timedelta
@@ -43,13 +44,11 @@ def load_data_files(input_folder):
 def load_and_parse_file(file_path):
     """Load and parse a single data file"""
     try:
-        df = pd.read_csv(file_path, skip_blank_lines=True)
+        # Parse the Date column while reading instead of converting it afterwards
+        df = pd.read_csv(file_path, skip_blank_lines=True, parse_dates=['Date'])
         # Check if we have the expected columns
         #expected_cols = ['Date', 'Time', 'Open', 'High', 'Low', 'Last', 'Volume', 'NumberOfTrades', 'BidVolume', 'AskVolume']
         df.columns = df.columns.str.strip()
-
-        # Convert Date column to datetime
-        df['Date'] = pd.to_datetime(df['Date'])
         
         # Ensure Volume is numeric
         #df['Volume'] = pd.to_numeric(df['Volume'], errors='coerce').fillna(0)
@@ -75,7 +74,11 @@ def consolidate_data(input_folder, output_folder):
         print(f"Loading {os.path.basename(file_path)}...")
         df = load_and_parse_file(file_path)
         if df is not None:
-            loaded_files[file_path] = df
+            # Sort by date once so each day's rows can be found with a binary search
+            df.sort_values('Date', inplace=True, kind='stable')
+            df.reset_index(drop=True, inplace=True)
+            dates64 = df['Date'].values.astype('datetime64[D]')
+            loaded_files[file_path] = (df, dates64)
         else:
             print(f"Failed to load {file_path}")
     
@@ -84,7 +87,7 @@ def consolidate_data(input_folder, output_folder):
     # Get overall date range from loaded files
     start_date = None
     end_date = None
-    for df in loaded_files.values():
+    for df, _ in loaded_files.values():
         if not df.empty:
             file_min = df['Date'].min()
             file_max = df['Date'].max()
@@ -104,23 +107,26 @@ def consolidate_data(input_folder, output_folder):
     log_entries = []
     
     # Process each day
-    current_date = start_date
-    if start_date is not None and end_date is not None and current_date is not None:
-        while current_date <= end_date:
-            date_str = current_date.strftime('%Y-%m-%d')
-            print(f"Processing {date_str}...")
-    else:
+    if start_date is None or end_date is None:
         print("No valid date range found. Skipping daily processing.")
         return None, None
+    
+    current_date = start_date
+    while current_date <= end_date:
+        date_str = current_date.strftime('%Y-%m-%d')
+        print(f"Processing {date_str}...")
         
         best_file = None
         best_volume = 0
         best_data = None
         
         # Check each loaded file for this date
-        for file_path, df in loaded_files.items():
-            # Filter data for current date
-            day_data = df[df['Date'].dt.date == current_date.date()]
+        target = np.datetime64(current_date.date())
+        for file_path, (df, dates64) in loaded_files.items():
+            # Locate the rows for current date in the sorted dates, instead of a full-column mask
+            lo = np.searchsorted(dates64, target, 'left')
+            hi = np.searchsorted(dates64, target, 'right')
+            day_data = df.iloc[lo:hi]
             
             if not day_data.empty:
                 # Calculate total volume for this day
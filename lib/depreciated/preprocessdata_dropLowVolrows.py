@@ -2,25 +2,54 @@
 #          a day where the front contract is something other than the contract being actively processed by the script.
 # TODO: integrate into the main script to automatically apply prior to exporting
 # - test code: current script not tested.
-# 
-import pandas as pd
+#
+# The file is streamed with the Arrow CSV reader in two passes, so it is never loaded into memory as a whole:
+# the first pass computes the average of the tail, the second filters batch by batch and writes the result as it scans.
+from collections import deque
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import pyarrow.compute as pc
 
 # Specify the path to your CSV file
 file_path = 'continuous_contract_20250616_223400.csv'
-
-# Load the CSV file into a DataFrame
-df = pd.read_csv(file_path)
+output_path = 'filtered_file.csv'
+tail_rows = 50000
 
 # Ensure column 'A' is numeric
-df['Volume'] = pd.to_numeric(df['Open'], errors='coerce')
+convert_options = pacsv.ConvertOptions(column_types={'Open': pa.float64()})
+
+# First pass: keep only the batches that cover the last 50,000 rows of column 'A'
+tail = deque()
+tail_length = 0
+for batch in pacsv.open_csv(file_path, convert_options=convert_options):
+    tail.append(batch.column('Open'))
+    tail_length += len(batch)
+    while tail and tail_length - len(tail[0]) >= tail_rows:
+        tail_length -= len(tail.popleft())
 
 # Compute the average value of the last 50,000 rows of column 'A'
-average_value_last_50k = df['Open'].tail(50000).mean()
+tail_values = pa.concat_arrays(list(tail)) if tail else pa.array([], type=pa.float64())
+average_value_last_50k = pc.mean(tail_values.slice(max(len(tail_values) - tail_rows, 0))).as_py()
 
-# Drop the rows whose column 'A' value is less than the computed average
-filtered_df = df[df['Open'] >= average_value_last_50k]
+def format_float_column(column):
+    # Write floats the way pandas' to_csv did: shortest repr, with '.0' kept on whole numbers
+    text = pc.cast(column, pa.string())
+    whole = pc.invert(pc.match_substring_regex(text, r'[.eEn]'))
+    return pc.if_else(whole, pc.binary_join_element_wise(text, '.0', ''), text)
 
-# Optionally, save the filtered DataFrame to a new CSV file
-filtered_df.to_csv('filtered_file.csv', index=False)
+# Second pass: drop the rows whose column 'A' value is less than the computed average,
+# writing the filtered batches to a new CSV file as they are read. Float columns are written
+# as formatted text and nothing is quoted, so the file keeps the layout of the input
+reader = pacsv.open_csv(file_path, convert_options=convert_options)
+float_columns = [i for i, field in enumerate(reader.schema) if pa.types.is_floating(field.type)]
+output_schema = reader.schema
+for i in float_columns:
+    output_schema = output_schema.set(i, pa.field(output_schema.field(i).name, pa.string()))
+write_options = pacsv.WriteOptions(quoting_style='none', quoting_header='none')
+with pacsv.CSVWriter(output_path, output_schema, write_options=write_options) as writer:
+    for batch in reader:
+        batch = batch.filter(pc.greater_equal(batch.column('Open'), average_value_last_50k))
+        columns = [format_float_column(column) if i in float_columns else column for i, column in enumerate(batch.columns)]
+        writer.write_batch(pa.RecordBatch.from_arrays(columns, schema=output_schema))
 
 print(f"Average value of the last 50,000 rows of column 'A': {average_value_last_50k}")
@@ -10,8 +10,18 @@ def check_timescaledb_installed():
 if not check_timescaledb_installed():
     print("TimescaleDB is not installed. Please install it using 'pip install timescaledb'.")
     sys.exit(1)
+import csv
+import io
+from itertools import islice
 import psycopg2
 from psycopg2 import sql
+from psycopg2.extras import execute_values
+
+# Rows per COPY buffer, to cap memory on very large uploads
+COPY_CHUNK_ROWS = 50000
+# Uploads smaller than this many rows use a multi-row INSERT instead of COPY
+COPY_THRESHOLD = int(os.getenv("COPY_THRESHOLD", "100"))
+
 def upload_to_postgres(data, table_name, db_config):
     """
     Upload data to a PostgreSQL database.
@@ -35,17 +45,35 @@ def upload_to_postgres(data, table_name, db_config):
         )
         cursor.execute(create_table_query)
 
-        # Insert data into the table
-        insert_query = sql.SQL(
-            "INSERT INTO {} ({}) VALUES ({})"
+        # Small uploads go through execute_values, which sends the values with their Python types
+        # instead of round-tripping them through CSV text
+        if len(data) < COPY_THRESHOLD:
+            insert_query = sql.SQL("INSERT INTO {} ({}) VALUES %s").format(
+                sql.Identifier(table_name),
+                sql.SQL(', ').join(sql.Identifier(col) for col in columns)
+            )
+            execute_values(cursor, insert_query, [tuple(row.values()) for row in data], page_size=1000)
+            conn.commit()
+            return
+
+        # Stream the data into the table with COPY instead of one INSERT per row
+        copy_query = sql.SQL(
+            "COPY {} ({}) FROM STDIN WITH (FORMAT CSV, DELIMITER E'\\t')"
         ).format(
             sql.Identifier(table_name),
-            sql.SQL(', ').join(sql.Identifier(col) for col in columns),
-            sql.SQL(', ').join(sql.Placeholder() * len(columns))
+            sql.SQL(', ').join(sql.Identifier(col) for col in columns)
         )
 
-        for row in data:
-            cursor.execute(insert_query, tuple(row.values()))
+        rows = iter(data)
+        while True:
+            chunk = list(islice(rows, COPY_CHUNK_ROWS))
+            if not chunk:
+                break
+            buf = io.StringIO()
+            writer = csv.writer(buf, delimiter='\t', quoting=csv.QUOTE_MINIMAL)
+            writer.writerows(row.values() for row in chunk)
+            buf.seek(0)
+            cursor.copy_expert(copy_query, buf)
 
         # Commit the transaction
         conn.commit()
@@ -6,16 +6,27 @@
 ##  time             | timestamp(3) without time zone |           | not null |
 ##  trade_date       | date                           |           |          |
 ##  trade_time       | time(3) without time zone      |           |          |
-##  open             | numeric(44,2)                  |           |          |
-##  high             | numeric(15,2)                  |           |          |
-##  low              | numeric(15,2)                  |           |          |
-##  close            | numeric(15,2)                  |           |          |
-##  volume           | integer                        |           |          |
-##  number_of_trades | integer                        |           |          |
-##  bid_volume       | integer                        |           |          |
-##  ask_volume       | integer                        |           |          |
+##  open             | double precision               |           |          |
+##  high             | double precision               |           |          |
+##  low              | double precision               |           |          |
+##  close            | double precision               |           |          |
+##  volume           | bigint                         |           |          |
+##  number_of_trades | bigint                         |           |          |
+##  bid_volume       | bigint                         |           |          |
+##  ask_volume       | bigint                         |           |          |
 ##  symbol           | text                           |           |          |
 ##  symbol_period    | text                           |           |          |
+## Prices and volumes use fixed-width types so the binary COPY sends 8-byte floats/ints instead of encoding every value as numeric.
+## To migrate a table created with numeric prices and integer volumes (with compression disabled, see below):
+# ALTER TABLE market_data
+#    ALTER COLUMN open TYPE double precision,
+#    ALTER COLUMN high TYPE double precision,
+#    ALTER COLUMN low TYPE double precision,
+#    ALTER COLUMN close TYPE double precision,
+#    ALTER COLUMN volume TYPE bigint,
+#    ALTER COLUMN number_of_trades TYPE bigint,
+#    ALTER COLUMN bid_volume TYPE bigint,
+#    ALTER COLUMN ask_volume TYPE bigint;
 ## if you need to change table columns, you can disable timescaledb.compress, and then re-enable it:
 # ALTER TABLE market_data SET (timescaledb.compress,
 #    timescaledb.compress_orderby = 'time ASC',
@@ -46,107 +57,182 @@ from pathlib import Path
 import time
 import os
 import json
+import mmap
 from dotenv import load_dotenv
 import re
+from datetime import datetime
+from itertools import repeat
+import pyarrow as pa
+try:
+    import pgpq  # Optional: encodes Arrow directly as binary COPY
+except ImportError:
+    pgpq = None
 
 # Load environment variables from .env file
 load_dotenv()
 
-# Establishes a connection to the PostgreSQL database using provided credentials.
-async def db_connect():
-    return await asyncpg.connect(
+# pgpq's binary COPY only matches the double precision/bigint schema above, so it is opt-in:
+# set USE_PGPQ=1 once market_data has been migrated. Tables with numeric/integer columns keep the records path.
+USE_PGPQ = pgpq is not None and os.getenv('USE_PGPQ', '').lower() in ('1', 'true', 'yes')
+
+# Rows per record batch handed to the pgpq encoder
+PGPQ_BATCH_ROWS = 100000
+
+# SCDateTime epoch is December 30, 1899
+SCID_EPOCH = np.datetime64('1899-12-30', 'us')
+
+# SCID files are a 56-byte header followed by fixed-size 40-byte records
+SCID_DTYPE = np.dtype([
+    ("scdatetime", "<u8"),
+    ("open", "<f4"),
+    ("high", "<f4"),
+    ("low", "<f4"),
+    ("close", "<f4"),
+    ("numtrades", "<u4"),
+    ("totalvolume", "<u4"),
+    ("bidvolume", "<u4"),
+    ("askvolume", "<u4"),
+])
+RECORD_SIZE = SCID_DTYPE.itemsize
+HEADER_SIZE = 56
+# Fields copied out of the records into columns. scdatetime is left out: the time column comes from get_scid_np
+SCID_VALUE_FIELDS = SCID_DTYPE.names[1:]
+
+# SCID file names look like ESU5.CME: root symbol, contract month + year, exchange
+SCID_FILENAME_RE = re.compile(r'^([A-Z]{2,3})([A-Z]\d)\.([A-Z]+)$')
+
+# Creates a connection pool to the PostgreSQL database using provided credentials. The pool is created once
+# and reused by every update cycle, so connection setup is not paid again on each poll.
+async def db_create_pool():
+    return await asyncpg.create_pool(
         host=os.getenv("DB_HOST"),
         user=os.getenv("DB_USER"),
         password=os.getenv("DB_PASSWORD"),
         database=os.getenv("DB_DATABASE"),
-        port=os.getenv("DB_PORT")
+        port=os.getenv("DB_PORT"),
+        min_size=2,
+        max_size=8
     )
 
-def get_scid_np(scidFile, offset=0):
+def get_scid_np(scidFile, offset=0, max_records=None):
     f = Path(scidFile)
     assert f.exists(), "SCID file not found"
-    with open(scidFile, 'rb') as file:
-        file.seek(0, os.SEEK_END)
-        file_size = file.tell()  # Total size of the file
-        sciddtype = np.dtype([
-            ("scdatetime", "<u8"),
-            ("open", "<f4"),
-            ("high", "<f4"),
-            ("low", "<f4"),
-            ("close", "<f4"),
-            ("numtrades", "<u4"),
-            ("totalvolume", "<u4"),
-            ("bidvolume", "<u4"),
-            ("askvolume", "<u4"),
-        ])
-        record_size = sciddtype.itemsize
-
-        # Adjust the offset if not within the file size
-        if offset >= file_size:
-            offset = file_size - (file_size % record_size)
-        elif offset < 56:
-            offset = 56  # Skip header assumed to be 56 bytes
-
-        file.seek(offset)
-        scid_as_np_array = np.fromfile(file, dtype=sciddtype)
-        new_position = file.tell()  # Update the position after reading
-
-    return scid_as_np_array, new_position
+    file_size = os.stat(scidFile).st_size  # Total size of the file
 
-# Inserts data into the specified table in the PostgreSQL database.
-async def load_data_to_db(conn, df, table_name, symbol, symbol_period):
-    # SCDateTime epoch is December 30, 1899
-    epoch = pl.datetime(1899, 12, 30, 0, 0, 0, 0, time_unit="us")
-
-    df = df.with_columns([
-        (epoch + pl.duration(microseconds=pl.col('scdatetime'))).alias('time'),
-        (epoch + pl.duration(microseconds=pl.col('scdatetime'))).cast(pl.Date).alias('trade_date'),
-        (epoch + pl.duration(microseconds=pl.col('scdatetime'))).cast(pl.Time).alias('trade_time'),
-        pl.col('open'), 
-        pl.col('high'), 
-        pl.col('low'), 
-        pl.col('close'), 
-        pl.col('totalvolume').alias('volume'),
-        pl.col('numtrades').alias('number_of_trades'),
-        pl.col('bidvolume').alias('bid_volume'),
-        pl.col('askvolume').alias('ask_volume'),
+    # Skip the header and snap the offset back onto a record boundary
+    offset = max(HEADER_SIZE, offset)
+    offset -= (offset - HEADER_SIZE) % RECORD_SIZE
+
+    # Map only the complete records after the offset instead of copying them into a fresh buffer
+    n_records = max(file_size - offset, 0) // RECORD_SIZE
+    if max_records is not None:
+        n_records = min(n_records, max_records)  # Read at most one chunk of records
+    if n_records > 0:
+        scid_as_np_array = np.memmap(scidFile, dtype=SCID_DTYPE, mode='r', offset=offset, shape=(n_records,))
+        if hasattr(mmap, 'MADV_SEQUENTIAL'):  # madvise is not available on Windows
+            scid_as_np_array._mmap.madvise(mmap.MADV_SEQUENTIAL)
+    else:
+        scid_as_np_array = np.empty(0, dtype=SCID_DTYPE)
+    new_position = offset + n_records * RECORD_SIZE  # Update the position after reading
+
+    # SCDateTime is a microsecond count from the December 30, 1899 epoch, so the time column is one vectorized add
+    scid_times = SCID_EPOCH + scid_as_np_array['scdatetime'].view('<i8').astype('timedelta64[us]')
+
+    return scid_as_np_array, scid_times, new_position
+
+# Returns an iterator of COPY records built from the structured SCID array, in the column order of load_data_to_db.
+# Every column is converted to native Python values in C (tolist / astype(object)), and the row tuples are
+# assembled by zip itself, so no Python-level code runs per row. The values already match asyncpg's binary COPY codecs.
+def iter_scid_records(scid_np_array, scid_times, symbol, symbol_period):
+    times = scid_times.astype(object)
+    return zip(
+        times,
+        scid_times.astype('datetime64[D]').astype(object),  # trade_date as datetime.date
+        map(datetime.time, times),  # trade_time as datetime.time, via the unbound method
+        scid_np_array['open'].tolist(),
+        scid_np_array['high'].tolist(),
+        scid_np_array['low'].tolist(),
+        scid_np_array['close'].tolist(),
+        scid_np_array['totalvolume'].tolist(),
+        scid_np_array['numtrades'].tolist(),
+        scid_np_array['bidvolume'].tolist(),
+        scid_np_array['askvolume'].tolist(),
+        repeat(symbol),
+        repeat(symbol_period),
+    )
+
+# Builds the market_data frame from the SCID columns, with the time column taken from the precomputed datetime64[us] array.
+# The transformations run as one lazy query on the streaming engine, so they are fused and only the selected columns are materialized.
+def build_scid_frame(scid_np_array, scid_times, symbol, symbol_period):
+    return pl.DataFrame({name: scid_np_array[name] for name in SCID_VALUE_FIELDS}).lazy().with_columns(pl.Series('time', scid_times)).with_columns([
+        pl.col('time').cast(pl.Date).alias('trade_date'),
+        pl.col('time').cast(pl.Time).alias('trade_time'),
+        pl.col('open').cast(pl.Float64), 
+        pl.col('high').cast(pl.Float64), 
+        pl.col('low').cast(pl.Float64), 
+        pl.col('close').cast(pl.Float64), 
+        pl.col('totalvolume').alias('volume').cast(pl.Int64),
+        pl.col('numtrades').alias('number_of_trades').cast(pl.Int64),
+        pl.col('bidvolume').alias('bid_volume').cast(pl.Int64),
+        pl.col('askvolume').alias('ask_volume').cast(pl.Int64),
         pl.lit(symbol).alias('symbol'),
         pl.lit(symbol_period).alias('symbol_period')
     ]).select([
         'time', 'trade_date', 'trade_time', 'open', 'high', 'low', 'close',
         'volume', 'number_of_trades', 'bid_volume', 'ask_volume', 'symbol', 'symbol_period'
-    ])
-
-
-    # Filter out rows with erroneous values (anything approaching 1e13)
-    # Using a more conservative threshold like 1e10 to be safe
-    # df_filtered = df.filter(
-    #     (pl.col('open').abs() > 1e10) |
-    #     (pl.col('high').abs() > 1e10) |
-    #     (pl.col('low').abs() > 1e10) |
-    #     (pl.col('close').abs() > 1e10) |
-    #     (pl.col('volume').abs() > 1e10) |
-    #     (pl.col('bid_volume').abs() > 1e10) |
-    #     (pl.col('ask_volume').abs() > 1e10)
-    # )
-
-    # # save filtered data to csv file for debugging
-    # debug_csv_path = Path(f"debug_{table_name}.csv")
-    # df_filtered.write_csv(debug_csv_path)
-    # print('saved filtered data to', debug_csv_path)
-    # gets the minimum value for each column
-    min_values = df.select([
-        pl.col('open').min().alias('min_open'),
-        pl.col('high').min().alias('min_high'),
-        pl.col('low').min().alias('min_low'),
-        pl.col('close').min().alias('min_close'),
-        pl.col('volume').min().alias('min_volume'),
-        pl.col('number_of_trades').min().alias('min_number_of_trades'),
-        pl.col('bid_volume').min().alias('min_bid_volume'),
-        pl.col('ask_volume').min().alias('min_ask_volume')
-    ]).to_dict(as_series=False)
-    print(f"Minimum values for {table_name}: {min_values}")
-    time.sleep(300)
+    ]).collect(engine="streaming")
+
+# Exports the market_data frame to Arrow in the types pgpq can encode: CompatLevel.oldest() gives large_string
+# for the text columns, and trade_time is cast from Polars' ns precision to us, since Postgres time has no ns.
+def to_pgpq_arrow(df):
+    arrow_table = df.to_arrow(compat_level=pl.CompatLevel.oldest())
+    trade_time_idx = arrow_table.schema.get_field_index('trade_time')
+    return arrow_table.set_column(trade_time_idx, 'trade_time', arrow_table['trade_time'].cast(pa.time64('us')))
+
+# Encodes an Arrow table as a Postgres binary COPY stream with pgpq, one record batch at a time.
+# No Python object is created per value; asyncpg sends the chunks as they are yielded.
+async def iter_pgpq_binary(arrow_table):
+    encoder = pgpq.ArrowToPostgresBinaryEncoder(arrow_table.schema)
+    yield encoder.write_header()
+    for batch in arrow_table.to_batches(max_chunksize=PGPQ_BATCH_ROWS):
+        yield encoder.write_batch(batch)
+    yield encoder.finish()
+
+# Inserts data into the specified table in the PostgreSQL database.
+async def load_data_to_db(conn, scid_np_array, scid_times, table_name, symbol, symbol_period):
+    # With USE_PGPQ the COPY is encoded straight from the Arrow form of this frame. Otherwise the COPY streams
+    # from the NumPy columns and the frame is only built for the debug min-value scan below
+    df = build_scid_frame(scid_np_array, scid_times, symbol, symbol_period) if USE_PGPQ or os.getenv('DEBUG_MIN_VALUES') else None
+
+    if os.getenv('DEBUG_MIN_VALUES'):
+        # Filter out rows with erroneous values (anything approaching 1e13)
+        # Using a more conservative threshold like 1e10 to be safe
+        # df_filtered = df.filter(
+        #     (pl.col('open').abs() > 1e10) |
+        #     (pl.col('high').abs() > 1e10) |
+        #     (pl.col('low').abs() > 1e10) |
+        #     (pl.col('close').abs() > 1e10) |
+        #     (pl.col('volume').abs() > 1e10) |
+        #     (pl.col('bid_volume').abs() > 1e10) |
+        #     (pl.col('ask_volume').abs() > 1e10)
+        # )
+
+        # # save filtered data to csv file for debugging
+        # debug_csv_path = Path(f"debug_{table_name}.csv")
+        # df_filtered.write_csv(debug_csv_path)
+        # print('saved filtered data to', debug_csv_path)
+        # gets the minimum value for each column
+        min_values = df.select([
+            pl.col('open').min().alias('min_open'),
+            pl.col('high').min().alias('min_high'),
+            pl.col('low').min().alias('min_low'),
+            pl.col('close').min().alias('min_close'),
+            pl.col('volume').min().alias('min_volume'),
+            pl.col('number_of_trades').min().alias('min_number_of_trades'),
+            pl.col('bid_volume').min().alias('min_bid_volume'),
+            pl.col('ask_volume').min().alias('min_ask_volume')
+        ]).to_dict(as_series=False)
+        print(f"Minimum values for {table_name}: {min_values}")
 
     # Use copy_records_to_table for efficient bulk loading
     columns = [
@@ -154,11 +240,19 @@ async def load_data_to_db(conn, df, table_name, symbol, symbol_period):
         'volume', 'number_of_trades', 'bid_volume', 'ask_volume', 'symbol', 'symbol_period'
     ]
 
-    await conn.copy_records_to_table(
-        table_name,
-        records=df.iter_rows(),
-        columns=columns
-    )
+    if USE_PGPQ:
+        await conn.copy_to_table(
+            table_name,
+            source=iter_pgpq_binary(to_pgpq_arrow(df)),
+            columns=columns,
+            format='binary'
+        )
+    else:
+        await conn.copy_records_to_table(
+            table_name,
+            records=iter_scid_records(scid_np_array, scid_times, symbol, symbol_period),
+            columns=columns
+        )
 
     # for reference, this is the executemany method that can be used instead of copy_records_to_table
     # depreciated as it used a lot of memory
@@ -171,18 +265,12 @@ async def load_data_to_db(conn, df, table_name, symbol, symbol_period):
     #     VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11, $12, $13)
     # """, records)
 
-# Coordinates the data processing workflow: connects to the database, reads data from the SCID file, and loads it into the database. Manages checkpoints to handle data continuity.
-async def main(table_name, scid_file):
-    start_time = time.time()
-    conn = await db_connect()
-
-    # Extract symbol and symbol_period from the file name
+# Extracts symbol and symbol_period from the file name. They never change for a given file, so this runs once per file, not per cycle.
+# Example: ESU5.CME.scid -> symbol: ES, symbol_period: U5
+def parse_scid_file_name(scid_file):
     file_name = Path(scid_file).stem  # Get file name without extension
 
-    # use regex to match the symbol and period
-    # Example: ESU5.CME.scid -> symbol: ESU5, symbol_period: CME
-    pattern = r'^([A-Z]{2,3})([A-Z]\d)\.([A-Z]+)$'
-    match = re.match(pattern, file_name)
+    match = SCID_FILENAME_RE.match(file_name)
     if match:
         symbol = match.group(1)
         symbol_period = match.group(2)
@@ -192,48 +280,77 @@ async def main(table_name, scid_file):
         parts = file_name.split('.')
         symbol = parts[0] if len(parts) > 0 else ""
         symbol_period = parts[1] if len(parts) > 1 else ""
+    return symbol, symbol_period
 
-    checkpoint_file = Path(f"checkpoint.json")
-
-    # Check if the initial load is done, otherwise set last_position to 0 and initial_load_done to False
-    last_position = 0
-    initial_load_done = False
-
-    if checkpoint_file.exists():
-        try:
+# Returns (last_position, initial_load_done) for a symbol's checkpoint file, falling back to the symbol's entry
+# in the old combined checkpoint.json the first time it runs.
+def read_checkpoint(checkpoint_file, symbol, symbol_period):
+    checkpoint_data = {}
+    try:
+        if checkpoint_file.exists():
             with open(checkpoint_file, "r") as f:
                 checkpoint_data = json.load(f)
-                # Ensure the correct table_name is used for checkpoint data retrieval
-                table_data = checkpoint_data.get(f'{symbol}{symbol_period}', {})
-                last_position = table_data.get("last_position", 0)
-                initial_load_done = table_data.get("initial_load_done", False)
-                print(f"Last position for {symbol}{symbol_period}: {last_position}, Initial load done: {initial_load_done}")
-        except json.JSONDecodeError:
-            checkpoint_data = {}
-            print("Checkpoint file is corrupted or empty. Starting fresh.")
-            pass
-
-    
+        elif Path("checkpoint.json").exists():
+            with open("checkpoint.json", "r") as f:
+                checkpoint_data = json.load(f).get(f'{symbol}{symbol_period}', {})
+    except json.JSONDecodeError:
+        print("Checkpoint file is corrupted or empty. Starting fresh.")
+        checkpoint_data = {}
+
+    last_position = checkpoint_data.get("last_position", 0)
+    initial_load_done = checkpoint_data.get("initial_load_done", False)
+    print(f"Last position for {symbol}{symbol_period}: {last_position}, Initial load done: {initial_load_done}")
+    return last_position, initial_load_done
+
+# Writes the checkpoint to a temporary file and swaps it in, so a crash mid-write never leaves a truncated checkpoint.
+def write_checkpoint(checkpoint_file, checkpoint_data):
+    tmp_file = checkpoint_file.with_suffix('.json.tmp')
+    with open(tmp_file, "w") as f:
+        json.dump(checkpoint_data, f)
+        f.flush()
+        os.fsync(f.fileno())  # Make sure the new checkpoint is on disk before it replaces the old one
+    os.replace(tmp_file, checkpoint_file)
+
+# Coordinates the data processing workflow: connects to the database, reads data from the SCID file, and loads it into the database. Manages checkpoints to handle data continuity.
+async def main(pool, table_name, scid_file, symbol, symbol_period):
+    start_time = time.time()
+
+    # Each symbol has its own small checkpoint file, so one cycle never rewrites the others' positions
+    checkpoint_file = Path(f"checkpoint_{symbol}{symbol_period}.json")
+
+    # Check if the initial load is done, otherwise last_position is 0 and initial_load_done is False
+    last_position, initial_load_done = read_checkpoint(checkpoint_file, symbol, symbol_period)
+
+    # Polling usually finds nothing new, so check the file size before mapping anything
+    if os.stat(scid_file).st_size - max(last_position, HEADER_SIZE) < RECORD_SIZE:
+        print(f"No new data to process for {table_name} at position {last_position}. Skipping update.")
+        return
+
     print(f"Processing SCID file: {scid_file}, Symbol: {symbol}, Period: {symbol_period}")
 
-    intermediate_np_array, new_position = get_scid_np(scid_file, offset=last_position)
+    # Read and load the new records in chunks so a large catch-up never holds the whole file in memory,
+    # checkpointing after every chunk so a crash mid-load resumes from the last loaded chunk
+    chunk_records = int(os.getenv("CHUNK_RECORDS", "1000000"))
+    chunks_loaded = 0
+    while True:
+        intermediate_np_array, scid_times, new_position = get_scid_np(scid_file, offset=last_position, max_records=chunk_records)
+        if new_position <= last_position:  # No more new data
+            break
 
-    if new_position > last_position:  # Only update if there's new data
-        df_raw = pl.DataFrame(intermediate_np_array)
-        await load_data_to_db(conn, df_raw, table_name, symbol, symbol_period)
+        async with pool.acquire() as conn:
+            await load_data_to_db(conn, intermediate_np_array, scid_times, table_name, symbol, symbol_period)
         last_position = new_position  # Updates the last position
+        chunks_loaded += 1
 
         # update the checkpoint file with the new position and initial load status
-        with open(checkpoint_file, "w") as f:
-            checkpoint_data[f'{symbol}{symbol_period}'] = {
-                "last_position": last_position, 
-                "initial_load_done": True
-                }
-            json.dump(checkpoint_data, f, indent=4)
-    else:
-        print(f"No new data to process for {table_name} at position {last_position}. Skipping update.")
+        checkpoint_data = {
+            "last_position": last_position, 
+            "initial_load_done": True
+            }
+        write_checkpoint(checkpoint_file, checkpoint_data)
 
-    await conn.close()
+    if chunks_loaded == 0:
+        print(f"No new data to process for {table_name} at position {last_position}. Skipping update.")
 
     end_time = time.time()
     print(f"Execution time: {end_time - start_time:.2f} seconds")
@@ -241,7 +358,12 @@ async def main(table_name, scid_file):
 table_name = "market_data"  # Specify the unique table name for your data.
 scid_file = r"C:\auxDrive\SierraChart2\Data\ESZ4.CME.scid"  # Set the file path to your SCID file.
 
-# Continuously update data from SCID file every 'x' seconds. Here, "1" means pause the execution for 1 second between updates.
-while True:
-    asyncio.run(main(table_name, scid_file))
-    time.sleep(1000)  # Pause for 1 second before the next update. Adjust as needed.
+# Continuously update data from SCID file every 'x' seconds, reusing one connection pool for the whole run.
+async def run_loop():
+    symbol, symbol_period = parse_scid_file_name(scid_file)
+    async with await db_create_pool() as pool:
+        while True:
+            await main(pool, table_name, scid_file, symbol, symbol_period)
+            await asyncio.sleep(1000)  # Pause for 1000 seconds before the next update. Adjust as needed.
+
+asyncio.run(run_loop())
@@ -2,10 +2,10 @@
 ## It assumes the following QuestDB table schema:
 ## CREATE TABLE trades (
 ##     time TIMESTAMP,                -- Designated timestamp for time-series queries
-##     open DOUBLE,                   -- Use DOUBLE for performance (see note above)
-##     high DOUBLE,
-##     low DOUBLE,
-##     close DOUBLE,
+##     open FLOAT,                    -- SCID prices are float32, so FLOAT keeps their full precision at half the width of DOUBLE
+##     high FLOAT,
+##     low FLOAT,
+##     close FLOAT,
 ##     volume INT,
 ##     number_of_trades INT,
 ##     bid_volume INT,
@@ -16,20 +16,29 @@
 ## ) TIMESTAMP(time)
 ## PARTITION BY DAY WAL
 ## DEDUP UPSERT KEYS(time, symbol, symbol_period);
+## Tables created earlier with DOUBLE prices keep working: QuestDB writes the ILP floats into the existing column type.
 
 import asyncio
 import polars as pl
 import numpy as np
+import pandas as pd
 import sys
 from pathlib import Path
 import time
 import os
 import json
+import logging
+import mmap
 from dotenv import load_dotenv
 import re
-from collections import deque
-from concurrent.futures import ThreadPoolExecutor
-from questdb.ingress import Sender, IngressError, TimestampNanos
+import math
+import queue
+import threading
+import glob
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import pyarrow as pa
+from questdb.ingress import Sender, IngressError
 import psycopg2
 
 class WorkerFailureException(Exception):
@@ -39,6 +48,33 @@ class WorkerFailureException(Exception):
 # Load environment variables from .env file
 load_dotenv('qdb.env')
 
+# The sender workers log through logging instead of print, so per-batch messages stay at DEBUG off the hot path
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# SCDateTime epoch is December 30, 1899
+SCID_EPOCH = np.datetime64('1899-12-30', 'us')
+
+# SCID files are a 56-byte header followed by fixed-size 40-byte records
+SCID_DTYPE = np.dtype([
+    ("scdatetime", "<u8"),
+    ("open", "<f4"),
+    ("high", "<f4"),
+    ("low", "<f4"),
+    ("close", "<f4"),
+    ("numtrades", "<u4"),
+    ("totalvolume", "<u4"),
+    ("bidvolume", "<u4"),
+    ("askvolume", "<u4"),
+])
+RECORD_SIZE = SCID_DTYPE.itemsize
+HEADER_SIZE = 56
+# Fields copied out of the records into columns. scdatetime is left out: the time column comes from get_scid_np
+SCID_VALUE_FIELDS = SCID_DTYPE.names[1:]
+
+# SCID file names look like ESU5.CME: root symbol, contract month + year, exchange
+SCID_FILENAME_RE = re.compile(r'^([A-Z]{2,3})([A-Z]\d)\.([A-Z]+)$')
+
 def create_table_if_not_exists(table_name, questdb_host, questdb_pg_port, user, password):
     """Create a table in QuestDB if it does not already exist."""
     conn_str = f"host='{questdb_host}' port='{questdb_pg_port}' dbname='qdb' user='{user}' password='{password}'"
@@ -48,10 +84,10 @@ def create_table_if_not_exists(table_name, questdb_host, questdb_pg_port, user,
                 create_table_query = f"""
                 CREATE TABLE IF NOT EXISTS {table_name} (
                     time TIMESTAMP,
-                    open DOUBLE,
-                    high DOUBLE,
-                    low DOUBLE,
-                    close DOUBLE,
+                    open FLOAT,
+                    high FLOAT,
+                    low FLOAT,
+                    close FLOAT,
                     volume INT,
                     number_of_trades INT,
                     bid_volume INT,
@@ -69,203 +105,235 @@ def create_table_if_not_exists(table_name, questdb_host, questdb_pg_port, user,
         print(f"Error connecting to QuestDB or creating table: {e}")
         sys.exit(1)
 
-def get_scid_np(scidFile, offset=0):
+def get_scid_np(scidFile, offset=0, max_records=None):
     f = Path(scidFile)
     assert f.exists(), "SCID file not found"
-    with open(scidFile, 'rb') as file:
-        file.seek(0, os.SEEK_END)
-        file_size = file.tell()  # Total size of the file
-        sciddtype = np.dtype([
-            ("scdatetime", "<u8"),
-            ("open", "<f4"),
-            ("high", "<f4"),
-            ("low", "<f4"),
-            ("close", "<f4"),
-            ("numtrades", "<u4"),
-            ("totalvolume", "<u4"),
-            ("bidvolume", "<u4"),
-            ("askvolume", "<u4"),
-        ])
-        record_size = sciddtype.itemsize
-
-        # Adjust the offset if not within the file size
-        if offset >= file_size:
-            offset = file_size - (file_size % record_size)
-        elif offset < 56:
-            offset = 56  # Skip header assumed to be 56 bytes
-
-        file.seek(offset)
-        scid_as_np_array = np.fromfile(file, dtype=sciddtype)
-        new_position = file.tell()  # Update the position after reading
-
-    return scid_as_np_array, new_position
-
-def send_batch(conf_str, table_name, batches, timestamp_name, df_pandas):
-    """Process batches of data and send to QuestDB"""
+    file_size = os.stat(scidFile).st_size  # Total size of the file
+
+    # Skip the header and snap the offset back onto a record boundary
+    offset = max(HEADER_SIZE, offset)
+    offset -= (offset - HEADER_SIZE) % RECORD_SIZE
+
+    # Map only the complete records after the offset instead of copying them into a fresh buffer
+    n_records = max(file_size - offset, 0) // RECORD_SIZE
+    if max_records is not None:
+        n_records = min(n_records, max_records)  # Read at most one chunk of records
+    if n_records > 0:
+        scid_as_np_array = np.memmap(scidFile, dtype=SCID_DTYPE, mode='r', offset=offset, shape=(n_records,))
+        if hasattr(mmap, 'MADV_SEQUENTIAL'):  # madvise is not available on Windows
+            scid_as_np_array._mmap.madvise(mmap.MADV_SEQUENTIAL)
+    else:
+        scid_as_np_array = np.empty(0, dtype=SCID_DTYPE)
+    new_position = offset + n_records * RECORD_SIZE  # Update the position after reading
+
+    # SCDateTime is a microsecond count from the December 30, 1899 epoch, so the time column is one vectorized add
+    scid_times = SCID_EPOCH + scid_as_np_array['scdatetime'].view('<i8').astype('timedelta64[us]')
+
+    return scid_as_np_array, scid_times, new_position
+
+def shard_to_ipc(shard):
+    """Serialize an Arrow shard to an IPC stream buffer. Unlike pickling the slice, only the shard's own rows are written"""
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, shard.schema) as writer:
+        writer.write_table(shard)
+    return sink.getvalue()
+
+# Long-lived objects reused across ingest cycles: the worker pool in the main process, and one Sender in each worker process
+_worker_pool = None
+_sender = None
+_sender_conf = None
+
+_worker_pool_lock = threading.Lock()
+
+def get_worker_pool(max_workers):
+    """Return the process pool, creating it on first use so worker processes (and their connections) outlive each cycle"""
+    global _worker_pool
+    with _worker_pool_lock:  # Several SCID files may ingest at once
+        if _worker_pool is None:
+            _worker_pool = ProcessPoolExecutor(max_workers=max_workers)
+    return _worker_pool
+
+def reset_worker_pool(broken_pool):
+    """Shut down a broken process pool and forget it, so the next cycle starts fresh worker processes"""
+    global _worker_pool
+    with _worker_pool_lock:
+        if _worker_pool is broken_pool:
+            _worker_pool = None
+    broken_pool.shutdown(wait=False, cancel_futures=True)
+
+def get_sender(conf_str):
+    """Return this worker process's connected Sender, connecting only on first use or after an error"""
+    global _sender, _sender_conf
+    if _sender is None or _sender_conf != conf_str:
+        close_sender()
+        _sender = Sender.from_conf(conf_str)
+        _sender.establish()
+        _sender_conf = conf_str
+    return _sender
+
+def close_sender(flush=True):
+    """Close this worker process's Sender, if any, so the next shard reconnects.
+
+    Pool workers exit through os._exit, so this is not run at exit. Nothing is left buffered then:
+    send_batch_shard flushes at the end of every shard, and the socket closes with the process.
+    """
+    global _sender
+    if _sender is not None:
+        sender, _sender = _sender, None
+        try:
+            sender.close(flush=flush)
+        except IngressError as e:
+            print(f"Error closing QuestDB sender: {e}")
+
+def send_batch_shard(conf_str, table_name, shard_ipc, symbol, symbol_period, batch_size):
+    """Send one worker's contiguous Arrow shard (an IPC stream buffer) of data to QuestDB in batches of batch_size rows"""
+    batch_count = 0
     try:
-        with Sender.from_conf(conf_str, auto_flush=False, init_buf_size=100_000_000) as qdb_sender:
-            batch_count = 0
-            failed = False
-            while True:
-                try:
-                    start_idx, end_idx = batches.pop()
-                    batch_count += 1
-                    print(f"Processing batch {batch_count} with {end_idx - start_idx} rows")
-
-                    # Only create the batch DataFrame when needed
-                    batch_df = df_pandas.iloc[start_idx:end_idx].copy()
-
-                    # Send the batch to QuestDB
-                    qdb_sender.dataframe(
-                        batch_df,
-                        table_name=table_name,
-                        symbols=['symbol', 'symbol_period'],  # Mark these columns as SYMBOL types
-                        at=timestamp_name
-                    )
-                    qdb_sender.flush()
-                    print(f"Successfully sent batch {batch_count}")
-
-                    # Explicitly delete the batch to free memory
-                    del batch_df
-
-                except IndexError:
-                    # No more batches to process
-                    break
-                except Exception as e:
-                    print(f"Error processing batch {batch_count}: {e}")
-                    failed = True
-                    # Re-add the batch to the queue for retry (optional)
-                    # batches.append((start_idx, end_idx))
-                    break
-
-            print(f"Thread completed. Processed {batch_count} batches.")
-            if failed:
-                raise Exception("One or more batches failed to process")
+        shard = pa.ipc.open_stream(shard_ipc).read_all()
+        # The sender auto-flushes every batch_size rows (see conf_str), so building the next batch
+        # overlaps with sending the previous one. The connection is kept open for the next shard
+        qdb_sender = get_sender(conf_str)
+        # Record batches are zero-copy slices of the shard
+        for batch in shard.to_batches(max_chunksize=batch_size):
+            batch_count += 1
+            logger.debug("Processing batch %d with %d rows", batch_count, batch.num_rows)
+
+            # Arrow-backed columns are serialized straight from the batch's buffers, without a NumPy copy.
+            # symbol and symbol_period are single-category columns and front_contract a constant, all False
+            batch_df = batch.to_pandas(types_mapper=pd.ArrowDtype)
+            codes = np.zeros(batch.num_rows, dtype=np.int8)
+            batch_df['symbol'] = pd.Categorical.from_codes(codes, categories=[symbol])
+            batch_df['symbol_period'] = pd.Categorical.from_codes(codes, categories=[symbol_period])
+            batch_df['front_contract'] = False
+
+            # An auto-flush IngressError raised here is handled below, the same way as the final flush
+            qdb_sender.dataframe(
+                batch_df,
+                table_name=table_name,
+                symbols=['symbol', 'symbol_period'],  # Mark these columns as SYMBOL types
+                at='time'
+            )
+            logger.debug("Successfully queued batch %d", batch_count)
+            if batch_count % 10 == 0:
+                logger.info("Queued %d batches", batch_count)
+
+        # Send the rest of the shard now, so the checkpoint is only written once every row has reached QuestDB
+        qdb_sender.flush()
+        logger.info("Worker completed. Processed %d batches.", batch_count)
 
     except IngressError as e:
-        print(f"QuestDB ingestion error: {e}")
-        raise  # Re-raise to propagate the error
+        logger.error("QuestDB ingestion error at batch %d: %s", batch_count, e)
+        close_sender(flush=False)  # Reconnect on the next shard
+        # IngressError cannot be unpickled in the parent process, so send its message back in a RuntimeError
+        raise RuntimeError(f"QuestDB ingestion error: {e}") from None
     except Exception as e:
-        print(f"Unexpected error in send_batch: {e}")
+        logger.error("Unexpected error in send_batch_shard: %s", e)
+        close_sender(flush=False)  # Reconnect on the next shard
         raise  # Re-raise to propagate the error
 
-def load_data_to_questdb(df, table_name, symbol, symbol_period, questdb_host='localhost', questdb_port=9009):
-    """Load data into QuestDB using parallel batch processing"""
-    
-    # SCDateTime epoch is December 30, 1899
-    epoch = pl.datetime(1899, 12, 30, 0, 0, 0, 0, time_unit="us")
-
-    # Process the dataframe to match QuestDB schema
-    df_processed = df.with_columns([
-        (epoch + pl.duration(microseconds=pl.col('scdatetime'))).alias('time'),
-        pl.col('open').cast(pl.Float64), 
-        pl.col('high').cast(pl.Float64), 
-        pl.col('low').cast(pl.Float64), 
-        pl.col('close').cast(pl.Float64), 
-        pl.col('totalvolume').alias('volume').cast(pl.Int32),
-        pl.col('numtrades').alias('number_of_trades').cast(pl.Int32),
-        pl.col('bidvolume').alias('bid_volume').cast(pl.Int32),
-        pl.col('askvolume').alias('ask_volume').cast(pl.Int32),
-        pl.lit(symbol).alias('symbol'),
-        pl.lit(symbol_period).alias('symbol_period'),
-        pl.lit(False).alias('front_contract')  # Add front_contract column, all False
-    ]).select([
-        'time', 'open', 'high', 'low', 'close',
-        'volume', 'number_of_trades', 'bid_volume', 'ask_volume', 'symbol', 'symbol_period', 'front_contract'
-    ])
-
-    # convert time column to int64 for QuestDB
-    df_processed = df_processed.with_columns(
-        pl.col('time').cast(pl.Int64).alias('time')
-    )
+async def ingest_shards(conf_str, table_name, shards, symbol, symbol_period, batch_size, parallel_workers):
+    """Send every shard concurrently and return each worker's result or exception, in shard order.
 
-    # Convert to Pandas for QuestDB ingestion
-    df_pandas = df_processed.to_pandas()
+    The ILP Sender is blocking, so each shard's sender runs in a
+    worker process (one long-lived connection per process) and the event loop only gathers them.
+    Shards are handed to the processes as Arrow IPC buffers.
+    """
+    loop = asyncio.get_running_loop()
+    executor = get_worker_pool(parallel_workers)
+    workers = []
+    try:
+        for i, shard in enumerate(shards):
+            workers.append(loop.run_in_executor(
+                executor, send_batch_shard, conf_str, table_name, shard_to_ipc(shard), symbol, symbol_period, batch_size
+            ))
+            print(f"Started worker {i+1}")
+    except BrokenProcessPool:
+        # A worker process died earlier; replace the pool before the next cycle
+        await asyncio.gather(*workers, return_exceptions=True)
+        reset_worker_pool(executor)
+        raise
+    results = await asyncio.gather(*workers, return_exceptions=True)
+
+    # A worker process that dies breaks the whole pool, so replace it instead of failing every later cycle
+    if any(isinstance(result, BrokenProcessPool) for result in results):
+        reset_worker_pool(executor)
+    return results
+
+def load_data_to_questdb(df, scid_times, table_name, symbol, symbol_period, questdb_host='localhost', questdb_port=9000, questdb_protocol='http'):
+    """Load data into QuestDB using parallel batch processing"""
 
-    # Ensure the timestamp column is properly formatted for QuestDB
-    df_pandas['time'] = pd.to_datetime(df_pandas['time'], utc=True, unit='us')
-    print(df_pandas.head())
-    #time.sleep(100000)  # Allow time for the print to flush before proceeding
-    
-    print(f"Preparing to load {len(df_pandas)} records to QuestDB")
+    # Process the dataframe to match QuestDB schema in a single projection: every output column is defined once,
+    # with its final dtype, and the lazy query runs on the streaming engine.
+    # time is the designated timestamp, taken as-is from the zero-copy datetime64[us] array
+    df_processed = df.lazy().select([
+        pl.lit(pl.Series('time', scid_times)).alias('time'),
+        pl.col('open'),  # prices stay float32, as stored in the SCID file
+        pl.col('high'), 
+        pl.col('low'), 
+        pl.col('close'), 
+        pl.col('totalvolume').cast(pl.Int32).alias('volume'),
+        pl.col('numtrades').cast(pl.Int32).alias('number_of_trades'),
+        pl.col('bidvolume').cast(pl.Int32).alias('bid_volume'),
+        pl.col('askvolume').cast(pl.Int32).alias('ask_volume'),
+    ]).collect(engine="streaming")
+
+    # Hand the data to the senders as Arrow. symbol, symbol_period and front_contract are constant
+    # for the whole file, so the workers add them to each batch instead of carrying them through the shards
+    table = df_processed.to_arrow()
+
+    print(f"Preparing to load {table.num_rows} records to QuestDB")
 
-    # Create batches using indices instead of copying data
-    batches = deque()
     batch_size = int(os.getenv("BATCH_SIZE", "200000"))  # Default 100k records per batch. Set to 1M for high performance
     parallel_workers = int(os.getenv("PARALLEL_WORKERS", "8"))  # Default 8 parallel connections
 
-    # Calculate batch indices instead of splitting the DataFrame
-    total_rows = len(df_pandas)
-    total_batches = total_rows // batch_size + (1 if total_rows % batch_size > 0 else 0)
-    print(f"Splitting data into {total_batches} batches of up to {batch_size} records each")
-
-    for i in range(total_batches):
-        start_idx = i * batch_size
-        end_idx = min((i + 1) * batch_size, total_rows)
-        if start_idx < end_idx:  # Only add non-empty batches
-            batches.append((start_idx, end_idx))
-            print(f"Created batch {i+1} with {end_idx - start_idx} records")
-
-    # QuestDB connection configuration
-    conf_str = f'http::addr={questdb_host}:{questdb_port};'
-    timestamp_name = 'time'
+    # Split the data once into one contiguous shard per worker. The shards are views, not copies
+    total_rows = table.num_rows
+    shard_size = math.ceil(total_rows / parallel_workers)
+    shards = [table.slice(i * shard_size, shard_size) for i in range(parallel_workers)]
+    shards = [shard for shard in shards if shard.num_rows > 0]  # Only keep non-empty shards
+    print(f"Splitting data into {len(shards)} shards of up to {shard_size} records each, sent in batches of up to {batch_size} records")
+
+    # QuestDB connection configuration. protocol_version=2 sends floats in binary, and the buffer is sized
+    # to one batch (~80 bytes per row on the wire) instead of a fixed 100 MB per worker.
+    # Over tcp each auto-flushed batch goes out as one contiguous socket write, with no per-request HTTP overhead
+    init_buf_size = batch_size * 96
+    conf_str = (
+        f'{questdb_protocol}::addr={questdb_host}:{questdb_port};protocol_version=2;'
+        f'auto_flush_rows={batch_size};auto_flush_bytes=off;init_buf_size={init_buf_size};'
+    )
 
-    print(f"Starting parallel ingestion with {parallel_workers} workers")
+    print(f"Starting parallel ingestion with {len(shards)} workers")
     start_time = time.time()
 
-    # Use ThreadPoolExecutor for parallel batch processing
-    with ThreadPoolExecutor(max_workers=parallel_workers) as executor:
-        futures = []
-        for i in range(parallel_workers):
-            future = executor.submit(send_batch, conf_str, table_name, batches, timestamp_name, df_pandas)
-            futures.append(future)
-            print(f"Started worker {i+1}")
-        
-        # Wait for all workers to complete
-        worker_failed = False
-        for i, future in enumerate(futures):
-            try:
-                future.result()
-                print(f"Worker {i+1} completed successfully")
-            except Exception as e:
-                print(f"Worker {i+1} failed with error: {e}")
-                worker_failed = True
+    # Run one sender per shard from a single event loop
+    results = asyncio.run(ingest_shards(conf_str, table_name, shards, symbol, symbol_period, batch_size, parallel_workers))
 
-        # If any worker failed, raise an exception to stop the process
-        if worker_failed:
-            raise WorkerFailureException("One or more workers failed during batch processing")
+    # Check the result of every worker
+    worker_failed = False
+    for i, result in enumerate(results):
+        if isinstance(result, Exception):
+            print(f"Worker {i+1} failed with error: {result}")
+            worker_failed = True
+        else:
+            print(f"Worker {i+1} completed successfully")
+
+    # If any worker failed, raise an exception to stop the process
+    if worker_failed:
+        raise WorkerFailureException("One or more workers failed during batch processing")
 
     end_time = time.time()
     print(f"Batch processing completed in {end_time - start_time:.2f} seconds")
-    
-    if not batches:
-        print("All batches processed successfully")
-    else:
-        print(f"Warning: {len(batches)} batches remaining unprocessed")
-
-def main(table_name, scid_file):
-    """Main processing function"""
-    start_time = time.time()
-    
-    # Get QuestDB connection details from environment variables for table creation
-    questdb_host = os.getenv("DB_HOST", "localhost")
-    questdb_pg_port = int(os.getenv("QUESTDB_PG_PORT", "8812"))  # Standard PG port for QuestDB, needed for create if not exist function
-    questdb_user = os.getenv("DB_USER", "admin")
-    questdb_password = os.getenv("DB_PASSWORD", "quest")
+    print("All batches processed successfully")
 
-    # Create table if it doesn't exist
-    create_table_if_not_exists(table_name, questdb_host, questdb_pg_port, questdb_user, questdb_password)
-
-    # Extract symbol and symbol_period from the file name
+def parse_scid_file_name(scid_file):
+    """Extract symbol and symbol_period from the file name. They never change for a given file, so this runs once, not per cycle"""
     file_name = Path(scid_file).stem  # Get file name without extension
 
-    # Use regex to match the symbol and period. Might need adjustment based on your SCID file naming conventions.
-    # Example: ESU5.CME.scid -> symbol: ESU5, symbol_period: CME
-    pattern = r'^([A-Z]{2,3})([A-Z]\d)\.([A-Z]+)$'
-    match = re.match(pattern, file_name)
+    # Might need adjustment based on your SCID file naming conventions.
     # pattern will return groups ('ES', 'U5', 'CME') for ESU5.CME.scid
+    match = SCID_FILENAME_RE.match(file_name)
     if match:
-        symbol = match.group(1)  # Combine symbol parts (ES + U5)
+        symbol = match.group(1)
         symbol_period = match.group(2)
     else:
         # Fallback to splitting by '.' if regex doesn't match   
@@ -273,70 +341,169 @@ def main(table_name, scid_file):
         parts = file_name.split('.')
         symbol = parts[0] if len(parts) > 0 else ""
         symbol_period = parts[1] if len(parts) > 1 else ""
+    return symbol, symbol_period
 
-    checkpoint_file = Path(f"checkpoint_qdb.json")
+def read_scid_chunks(scid_file, offset, chunk_records, chunks, stop_event):
+    """Reader thread: put successive chunks of new records on the queue, then None once caught up.
 
-    # Check if the initial load is done, otherwise set last_position to 0 and initial_load_done to False
-    last_position = 0
-    initial_load_done = False
-    checkpoint_data = {}
+    Each chunk is copied out of the memory map into a Polars frame here, so the disk reads happen on this
+    thread while the previous chunk is being ingested. An exception is put on the queue instead of None.
+    """
+    def put(item):
+        # Don't block forever on a full queue once ingestion has stopped
+        while not stop_event.is_set():
+            try:
+                chunks.put(item, timeout=1)
+                return True
+            except queue.Full:
+                continue
+        return False
 
-    if checkpoint_file.exists():
-        try:
+    try:
+        while not stop_event.is_set():
+            scid_np_array, scid_times, new_position = get_scid_np(scid_file, offset=offset, max_records=chunk_records)
+            if new_position <= offset:  # No more new data
+                break
+            df_raw = pl.DataFrame({name: scid_np_array[name] for name in SCID_VALUE_FIELDS})
+            if not put((df_raw, scid_times, new_position)):
+                return
+            offset = new_position
+        put(None)
+    except Exception as e:
+        print(f"Error reading SCID file: {e}")
+        put(e)
+
+def read_checkpoint(checkpoint_file, symbol, symbol_period):
+    """Return (last_position, initial_load_done) for a symbol's checkpoint file.
+
+    Falls back to the symbol's entry in the old combined checkpoint_qdb.json the first time it runs.
+    """
+    checkpoint_data = {}
+    try:
+        if checkpoint_file.exists():
             with open(checkpoint_file, "r") as f:
                 checkpoint_data = json.load(f)
-                # Ensure the correct table_name is used for checkpoint data retrieval
-                table_data = checkpoint_data.get(f'{symbol}{symbol_period}', {})
-                last_position = table_data.get("last_position", 0)
-                initial_load_done = table_data.get("initial_load_done", False)
-                print(f"Last position for {symbol}{symbol_period}: {last_position}, Initial load done: {initial_load_done}")
-        except json.JSONDecodeError:
-            checkpoint_data = {}
-            print("Checkpoint file is corrupted or empty. Starting fresh.")
+        elif Path("checkpoint_qdb.json").exists():
+            with open("checkpoint_qdb.json", "r") as f:
+                checkpoint_data = json.load(f).get(f'{symbol}{symbol_period}', {})
+    except json.JSONDecodeError:
+        print("Checkpoint file is corrupted or empty. Starting fresh.")
+        checkpoint_data = {}
+
+    last_position = checkpoint_data.get("last_position", 0)
+    initial_load_done = checkpoint_data.get("initial_load_done", False)
+    print(f"Last position for {symbol}{symbol_period}: {last_position}, Initial load done: {initial_load_done}")
+    return last_position, initial_load_done
+
+def write_checkpoint(checkpoint_file, checkpoint_data):
+    """Write the checkpoint to a temporary file and swap it in, so a crash mid-write never leaves a truncated checkpoint"""
+    tmp_file = checkpoint_file.with_suffix('.json.tmp')
+    with open(tmp_file, "w") as f:
+        json.dump(checkpoint_data, f)
+        f.flush()
+        os.fsync(f.fileno())  # Make sure the new checkpoint is on disk before it replaces the old one
+    os.replace(tmp_file, checkpoint_file)
+
+def main(table_name, scid_file, symbol, symbol_period):
+    """Main processing function"""
+    start_time = time.time()
+    
+    # Get QuestDB connection details from environment variables for table creation
+    questdb_host = os.getenv("DB_HOST", "localhost")
+    questdb_pg_port = int(os.getenv("QUESTDB_PG_PORT", "8812"))  # Standard PG port for QuestDB, needed for create if not exist function
+    questdb_user = os.getenv("DB_USER", "admin")
+    questdb_password = os.getenv("DB_PASSWORD", "quest")
+
+    # Create table if it doesn't exist
+    create_table_if_not_exists(table_name, questdb_host, questdb_pg_port, questdb_user, questdb_password)
+
+    # Each symbol has its own small checkpoint file, so one cycle never rewrites the others' positions
+    checkpoint_file = Path(f"checkpoint_qdb_{symbol}{symbol_period}.json")
+
+    # Check if the initial load is done, otherwise last_position is 0 and initial_load_done is False
+    last_position, initial_load_done = read_checkpoint(checkpoint_file, symbol, symbol_period)
+
+    # Polling usually finds nothing new, so check the file size before mapping anything
+    if os.stat(scid_file).st_size - max(last_position, HEADER_SIZE) < RECORD_SIZE:
+        print(f"No new data to process for {table_name} at position {last_position}. Skipping update.")
+        return
 
     print(f"Processing SCID file: {scid_file}, Symbol: {symbol}, Period: {symbol_period}")
 
-    intermediate_np_array, new_position = get_scid_np(scid_file, offset=last_position)
-
-    if new_position > last_position:  # Only update if there's new data
-        print(f"Found {len(intermediate_np_array)} new records")
-        df_raw = pl.DataFrame(intermediate_np_array)
-        
-        # Get QuestDB connection details from environment variables
-        questdb_host = os.getenv("DB_HOST", "localhost")
-        questdb_port = int(os.getenv("DB_PORT", "9000"))
-        
-        load_data_to_questdb(df_raw, table_name, symbol, symbol_period, questdb_host, questdb_port)
-        
-        last_position = new_position  # Updates the last position
-
-        # Update the checkpoint file with the new position and initial load status
-        checkpoint_data[f'{symbol}{symbol_period}'] = {
-            "last_position": last_position, 
-            "initial_load_done": True
-        }
-        
-        with open(checkpoint_file, "w") as f:
-            json.dump(checkpoint_data, f, indent=4)
+    # Get QuestDB connection details from environment variables
+    # QUESTDB_PROTOCOL=tcp sends ILP over raw TCP (port 9009 by default) instead of HTTP (port 9000), which is faster for large backfills
+    questdb_host = os.getenv("DB_HOST", "localhost")
+    questdb_protocol = os.getenv("QUESTDB_PROTOCOL", "http")
+    questdb_port = int(os.getenv("DB_PORT", "9009" if questdb_protocol == "tcp" else "9000"))
+
+    # Read and load the new records in chunks so a large catch-up never holds the whole file in memory,
+    # checkpointing after every chunk so a crash mid-load resumes from the last loaded chunk
+    # A reader thread reads the next chunk from disk while the current one is sent to QuestDB
+    chunk_records = int(os.getenv("CHUNK_RECORDS", "1000000"))
+    chunks = queue.Queue(maxsize=2)
+    stop_event = threading.Event()
+    reader = threading.Thread(
+        target=read_scid_chunks, args=(scid_file, last_position, chunk_records, chunks, stop_event), daemon=True
+    )
+    reader.start()
+
+    chunks_loaded = 0
+    try:
+        while True:
+            chunk = chunks.get()
+            if chunk is None:  # No more new data
+                break
+            if isinstance(chunk, Exception):
+                raise chunk  # The reader failed
+
+            df_raw, scid_times, new_position = chunk
+            print(f"Found {len(df_raw)} new records")
+
+            load_data_to_questdb(df_raw, scid_times, table_name, symbol, symbol_period, questdb_host, questdb_port, questdb_protocol)
             
-        print(f"Checkpoint updated: position {last_position}")
-    else:
+            last_position = new_position  # Updates the last position
+            chunks_loaded += 1
+
+            # Update the checkpoint file with the new position and initial load status
+            checkpoint_data = {
+                "last_position": last_position, 
+                "initial_load_done": True
+            }
+            write_checkpoint(checkpoint_file, checkpoint_data)
+                
+            print(f"Checkpoint updated: position {last_position}")
+    finally:
+        # Stop the reader if ingestion failed before it caught up
+        stop_event.set()
+        reader.join()
+
+    if chunks_loaded == 0:
         print(f"No new data to process for {table_name} at position {last_position}. Skipping update.")
 
     end_time = time.time()
     print(f"Total execution time: {end_time - start_time:.2f} seconds")
 
 if __name__ == "__main__":
-    # Import pandas here since it's needed for QuestDB ingestion
-    import pandas as pd
-    
     table_name = "trades"  # QuestDB table name
-    scid_file = r"C:\auxDrive\SierraChart2\Data\ESM5.CME.scid"  # Set the file path to your SCID file.
+    # Set the path to your SCID file, or a glob such as C:\auxDrive\SierraChart2\Data\*.scid to load several contracts.
+    scid_files = sorted(glob.glob(os.getenv("SCID_GLOB", r"C:\auxDrive\SierraChart2\Data\ESM5.CME.scid")))
+    if not scid_files:
+        print("No SCID files found. Check SCID_GLOB.")
+        sys.exit(1)
+    file_symbols = {scid_file: parse_scid_file_name(scid_file) for scid_file in scid_files}
 
-    # Continuously update data from SCID file every 'x' seconds
+    # Continuously update data from the SCID files every 'x' seconds. Each file writes its own (symbol, symbol_period)
+    # rows and has its own checkpoint, so the files are processed concurrently, one thread per file,
+    # all sharing the same pool of sender processes
     while True:
         try:
-            main(table_name, scid_file)
+            with ThreadPoolExecutor(max_workers=len(scid_files)) as file_executor:
+                futures = [
+                    file_executor.submit(main, table_name, scid_file, *file_symbols[scid_file])
+                    for scid_file in scid_files
+                ]
+                for future in futures:
+                    future.result()  # Re-raises the first failure
             sleep_duration = int(os.getenv("SLEEP_DURATION", "1000"))  # Default 1000 seconds
             print(f"Sleeping for {sleep_duration} seconds...")
             time.sleep(sleep_duration)